@@ -7,6 +7,7 @@ from spamwatch.client import Client as SWClient
 
 from . import Client, Config, Database
 from .utils import PluginManager, TGChannelLogHandler, helpers
+from .utils.sweeper import Sweeper
 
 logger = logzero.setup_logger('kantek-logger', level=logging.DEBUG)
 telethon_logger = logzero.setup_logger('telethon', level=logging.INFO)
@@ -43,6 +44,10 @@ async def amain() -> None:
     logger.info('Connecting to Database')
     client.db = db
 
+    if config.sweep_interval:
+        client.sweeper = Sweeper(client, config.sweep_interval)
+        client.sweeper.start()
+
     tlog.info('Started Kantek v%s [%s]', __version__, helpers.link_commit(helpers.get_commit()))
     logger.info('Started Kantek v%s', __version__)
 
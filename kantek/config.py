@@ -40,6 +40,28 @@ class ConfigWrapper:
 
     debug_mode: bool = False
 
+    mhash_index: str = 'multi'
+
+    photo_hash_source: str = 'full'
+
+    photo_hash_workers: int = 2
+
+    photo_hash_queue_size: int = 64
+
+    event_workers: int = 16
+
+    event_queue_size: int = 5_000
+
+    banlist_index: str = 'set'
+
+    banlist_bloom_error_rate: float = 0.001
+
+    persist_url_cache: bool = False
+
+    persist_photo_hashes: bool = False
+
+    sweep_interval: float = 0
+
     kill_command: Optional[str] = None
 
     source_url: str = 'src.kv2.dev'
@@ -1,3 +1,3 @@
 from .database_wrapper import Database
-from .types import Chat, Template, BlacklistItem, BannedUser
+from .types import Chat, Template, BlacklistItem, BannedUser, ResolvedUrl
 from .errors import UnknownDatabaseError, DeprecatedDatabaseError, ItemDoesNotExistError, TemplateAlreadyExistsError
@@ -1,6 +1,7 @@
 from typing import Union
 
-from .tables import Banlist, Blacklists, Chats, Strafanzeigen, Templates
+from .tables import (Banlist, Blacklists, Chats, Strafanzeigen, Templates, ResolvedUrls, PhotoHashes,
+                     DocumentHashes)
 from .tables.bundesnachrichtendienst import Bundesnachrichtendienst
 from .. import Config
 from .errors import DeprecatedDatabaseError, UnknownDatabaseError
@@ -23,10 +24,18 @@ class Database:
             raise UnknownDatabaseError('Choose from: postgres')
         self.strafanzeigen = Strafanzeigen(self)
         self.banlist = Banlist(self)
+        await self.banlist.load()
         self.blacklists = Blacklists(self)
+        await self.blacklists.load()
         self.chats = Chats(self)
+        await self.chats.load()
         self.templates = Templates(self)
         self.bundesnachrichtendienst = Bundesnachrichtendienst(self)
+        self.resolved_urls = ResolvedUrls(self)
+        self.photo_hashes = PhotoHashes(self)
+        self.document_hashes = DocumentHashes(self)
+        if config.persist_url_cache:
+            await self.resolved_urls.cleanup()
 
     async def disconnect(self):
         await self.db.disconnect()
@@ -34,3 +43,4 @@ class Database:
     async def cleanup(self):
         """This function gets called on every new message and can be used to run cleanup tasks"""
         await self.strafanzeigen.cleanup()
+        await self.document_hashes.cleanup()
@@ -0,0 +1,497 @@
+"""In-memory matchers to check content against blacklists without querying the database for every item."""
+import heapq
+import math
+from array import array
+from bisect import bisect_left
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class ExactIndex:
+    """Map of values to the indices of their blacklist items
+
+    >>> index = ExactIndex()
+    >>> index.add('example.com', 4)
+    >>> index.add('example.com', 2)
+    >>> index.search('example.com')
+    2
+    >>> index.remove(2)
+    >>> index.search('example.com')
+    4
+    """
+
+    def __init__(self) -> None:
+        self.values: Dict[int, str] = {}
+        self._indices: Dict[str, Set[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def add(self, value: str, index: int) -> None:
+        """Add a value for the blacklist item with the index"""
+        self.remove(index)
+        self.values[index] = value
+        self._indices.setdefault(value, set()).add(index)
+
+    def remove(self, index: int) -> None:
+        """Remove the value of the blacklist item with the index if it exists"""
+        value = self.values.pop(index, None)
+        if value is None:
+            return
+        indices = self._indices[value]
+        indices.discard(index)
+        if not indices:
+            del self._indices[value]
+
+    def search(self, value: str) -> Optional[int]:
+        """Return the lowest index of the value or None"""
+        indices = self._indices.get(value)
+        return min(indices) if indices else None
+
+
+class AhoCorasick:
+    """Aho-Corasick automaton mapping substrings to the index of their blacklist item
+
+    Adding or removing patterns only updates the trie, the failure links are rebuilt lazily on the next search.
+
+    >>> ac = AhoCorasick()
+    >>> ac.add('bitcoin', 3)
+    >>> ac.add('invest', 7)
+    >>> ac.add('coin', 1)
+    >>> ac.search('invest with bitcoin')
+    1
+    >>> ac.remove(1)
+    >>> ac.search('invest with bitcoin')
+    3
+    >>> ac.search('nothing to see here') is None
+    True
+    >>> ac.add('she', 9)
+    >>> ac.add('hers', 8)
+    >>> ac.search('ushers')
+    8
+    """
+
+    def __init__(self) -> None:
+        self.values: Dict[int, str] = {}
+        self._goto: List[Dict[str, int]] = [{}]
+        self._terminals: Dict[int, Set[int]] = {}
+        self._fail: List[int] = [0]
+        self._best: List[Optional[int]] = [None]
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def add(self, pattern: str, index: int) -> None:
+        """Add a pattern for the blacklist item with the index. Empty patterns are ignored."""
+        if not pattern:
+            return
+        self.remove(index)
+        node = 0
+        for char in pattern:
+            _next = self._goto[node].get(char)
+            if _next is None:
+                _next = len(self._goto)
+                self._goto.append({})
+                self._goto[node][char] = _next
+            node = _next
+        self._terminals.setdefault(node, set()).add(index)
+        self.values[index] = pattern
+        self._dirty = True
+
+    def remove(self, index: int) -> None:
+        """Remove the pattern of the blacklist item with the index if it exists"""
+        pattern = self.values.pop(index, None)
+        if pattern is None:
+            return
+        node = 0
+        for char in pattern:
+            node = self._goto[node][char]
+        self._terminals[node].discard(index)
+        self._dirty = True
+
+    def search(self, text: str) -> Optional[int]:
+        """Return the lowest index of all patterns contained in the text or None"""
+        if self._dirty:
+            self._build()
+        goto = self._goto
+        fail = self._fail
+        best = self._best
+        result = None
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            index = best[node]
+            if index is not None and (result is None or index < result):
+                result = index
+        return result
+
+    def _build(self) -> None:
+        """Compute the failure links and the lowest index reachable through them for every node"""
+        size = len(self._goto)
+        self._fail = [0] * size
+        self._best = [None] * size
+        queue = deque()
+        for child in self._goto[0].values():
+            self._best[child] = self._own_best(child)
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                own = self._own_best(child)
+                inherited = self._best[self._fail[child]]
+                if own is None or (inherited is not None and inherited < own):
+                    own = inherited
+                self._best[child] = own
+                queue.append(child)
+        self._dirty = False
+
+    def _own_best(self, node: int) -> Optional[int]:
+        indices = self._terminals.get(node)
+        return min(indices) if indices else None
+
+
+class HammingIndex:
+    """Multi-index of fixed width hex hashes to find hashes within a hamming distance
+
+    Like photohash.hash_distance the distance is the number of differing hex digits. The digits are split into
+    tolerance + 1 blocks, by the pigeonhole principle two hashes within the tolerance are equal in at least one
+    block. Only hashes sharing a block with the query are compared.
+
+    >>> index = HammingIndex(tolerance=2)
+    >>> index.add('ffff0000ffff0000', 5)
+    >>> index.add('ffff0000ffff00ff', 2)
+    >>> index.search('0fff0000ffff0001')
+    5
+    >>> index.search('0fff0000ffff00f1')
+    2
+    >>> index.search('00000000ffff0000') is None
+    True
+
+    Args:
+        tolerance: The maximum distance of a match
+        width: The length of the hashes in hex digits
+    """
+
+    def __init__(self, tolerance: int = 2, width: int = 16) -> None:
+        self.tolerance = tolerance
+        self.width = width
+        self.values: Dict[int, str] = {}
+        self._hashes: Dict[int, int] = {}
+        self._nibble_mask = int('1' * width, 16)
+        blocks = tolerance + 1
+        self._blocks = []
+        start = 0
+        for block in range(blocks):
+            size = width // blocks + (1 if block < width % blocks else 0)
+            self._blocks.append((start * 4, (1 << (size * 4)) - 1))
+            start += size
+        self._tables: List[Dict[int, Set[int]]] = [{} for _ in self._blocks]
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def add(self, value: str, index: int) -> None:
+        """Add a hash for the blacklist item with the index. Hashes with a different width are ignored."""
+        _hash = self._parse(value)
+        if _hash is None:
+            return
+        self.remove(index)
+        self.values[index] = value
+        self._hashes[index] = _hash
+        for table, (shift, mask) in zip(self._tables, self._blocks):
+            table.setdefault((_hash >> shift) & mask, set()).add(index)
+
+    def remove(self, index: int) -> None:
+        """Remove the hash of the blacklist item with the index if it exists"""
+        _hash = self._hashes.pop(index, None)
+        if _hash is None:
+            return
+        del self.values[index]
+        for table, (shift, mask) in zip(self._tables, self._blocks):
+            key = (_hash >> shift) & mask
+            table[key].discard(index)
+            if not table[key]:
+                del table[key]
+
+    def search(self, value: str) -> Optional[int]:
+        """Return the lowest index of all hashes within the tolerance or None"""
+        _hash = self._parse(value)
+        if _hash is None:
+            return None
+        result = None
+        checked = set()
+        for table, (shift, mask) in zip(self._tables, self._blocks):
+            for index in table.get((_hash >> shift) & mask, ()):
+                if index in checked or (result is not None and index > result):
+                    continue
+                checked.add(index)
+                if self.distance(_hash, self._hashes[index]) <= self.tolerance:
+                    result = index
+        return result
+
+    def distance(self, left: int, right: int) -> int:
+        """Count the hex digits that differ between two hashes"""
+        diff = left ^ right
+        return bin((diff | diff >> 1 | diff >> 2 | diff >> 3) & self._nibble_mask).count('1')
+
+    def _parse(self, value: str) -> Optional[int]:
+        if len(value) != self.width:
+            return None
+        try:
+            return int(value, 16)
+        except ValueError:
+            return None
+
+
+class PackedHammingIndex:
+    """Hex hashes packed into a numpy array that is scanned with a single vectorized comparison
+
+    Uses the same distance as HammingIndex but compares every hash, it is mostly useful as a baseline.
+    Added hashes are packed into the arrays in one go before the next search, the retired ones are dropped then.
+    Requires numpy to be installed.
+
+    Args:
+        tolerance: The maximum distance of a match
+    """
+    width = 16
+
+    def __init__(self, tolerance: int = 2) -> None:
+        if np is None:
+            raise ImportError('numpy is required for the packed hamming index')
+        self.tolerance = tolerance
+        self.values: Dict[int, str] = {}
+        self._parsed: Dict[int, int] = {}
+        self._hashes = np.zeros(0, dtype=np.uint64)
+        self._indices = np.zeros(0, dtype=np.int64)
+        self._retired = np.zeros(0, dtype=bool)
+        # set when hashes were added that aren't packed into the arrays yet
+        self._dirty = False
+        self._nibble_mask = np.uint64(int('1' * self.width, 16))
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def add(self, value: str, index: int) -> None:
+        """Add a hash for the blacklist item with the index. Hashes with a different width are ignored."""
+        if len(value) != self.width:
+            return
+        try:
+            _hash = int(value, 16)
+        except ValueError:
+            return
+        self.remove(index)
+        self.values[index] = value
+        self._parsed[index] = _hash
+        self._dirty = True
+
+    def remove(self, index: int) -> None:
+        """Flag the hash of the blacklist item with the index as retired"""
+        if self.values.pop(index, None) is not None:
+            del self._parsed[index]
+            if not self._dirty:
+                # the next pack leaves the hash out anyway
+                self._retired[self._indices == index] = True
+
+    def search(self, value: str) -> Optional[int]:
+        """Return the lowest index of all hashes within the tolerance or None"""
+        if len(value) != self.width or not self.values:
+            return None
+        try:
+            _hash = np.uint64(int(value, 16))
+        except ValueError:
+            return None
+        if self._dirty:
+            self._pack()
+        diff = self._hashes ^ _hash
+        nibbles = (diff | diff >> np.uint64(1) | diff >> np.uint64(2) | diff >> np.uint64(3)) & self._nibble_mask
+        matches = (_popcount(nibbles) <= self.tolerance) & ~self._retired
+        if not matches.any():
+            return None
+        return int(self._indices[matches].min())
+
+    def _pack(self) -> None:
+        """Rebuild the arrays from the current hashes which also drops the retired ones"""
+        count = len(self._parsed)
+        self._hashes = np.fromiter(self._parsed.values(), dtype=np.uint64, count=count)
+        self._indices = np.fromiter(self._parsed.keys(), dtype=np.int64, count=count)
+        self._retired = np.zeros(count, dtype=bool)
+        self._dirty = False
+
+
+def _popcount(values: 'np.ndarray') -> 'np.ndarray':
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    return np.unpackbits(values.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+class IdSet:
+    """Set of user ids stored as a sorted array of 64 bit integers
+
+    Uses 8 bytes per id instead of the ~70 of a python set so millions of ids fit in memory. Changes are
+    collected in small sets and merged into the array once there are merge_threshold of them.
+
+    >>> ids = IdSet([5, 3, 8])
+    >>> 3 in ids, 4 in ids
+    (True, False)
+    >>> ids.add(4)
+    >>> ids.remove(8)
+    >>> sorted(ids)
+    [3, 4, 5]
+    >>> len(ids)
+    3
+
+    Args:
+        ids: The initial ids
+        merge_threshold: Amount of pending changes that triggers a merge
+    """
+
+    def __init__(self, ids: Iterable[int] = (), merge_threshold: int = 10_000) -> None:
+        self.merge_threshold = merge_threshold
+        self._ids = array('q', sorted(set(ids)))
+        self._added: Set[int] = set()
+        self._removed: Set[int] = set()
+
+    @classmethod
+    def from_sorted(cls, ids: 'array[int]', merge_threshold: int = 10_000) -> 'IdSet':
+        """Use an array of unique ids sorted in ascending order without copying it"""
+        id_set = cls(merge_threshold=merge_threshold)
+        id_set._ids = ids
+        return id_set
+
+    def __len__(self) -> int:
+        return len(self._ids) + len(self._added) - len(self._removed)
+
+    def __contains__(self, uid: int) -> bool:
+        if uid in self._added:
+            return True
+        if uid in self._removed:
+            return False
+        return self._in_array(uid)
+
+    def __iter__(self):
+        return heapq.merge((uid for uid in self._ids if uid not in self._removed), sorted(self._added))
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory used by the ids"""
+        # a set entry is roughly its hash table slot plus the int object
+        pending = (len(self._added) + len(self._removed)) * 70
+        return self._ids.itemsize * len(self._ids) + pending
+
+    def add(self, uid: int) -> None:
+        self._removed.discard(uid)
+        if not self._in_array(uid):
+            self._added.add(uid)
+            self._maybe_merge()
+
+    def remove(self, uid: int) -> None:
+        self._added.discard(uid)
+        if self._in_array(uid):
+            self._removed.add(uid)
+            self._maybe_merge()
+
+    def _in_array(self, uid: int) -> bool:
+        pos = bisect_left(self._ids, uid)
+        return pos < len(self._ids) and self._ids[pos] == uid
+
+    def _maybe_merge(self) -> None:
+        if len(self._added) + len(self._removed) >= self.merge_threshold:
+            self._ids = array('q', iter(self))
+            self._added = set()
+            self._removed = set()
+
+
+_MASK_64 = (1 << 64) - 1
+
+
+def _mix(value: int) -> int:
+    """splitmix64 finalizer to spread sequential ids over all bits"""
+    value = (value + 0x9E3779B97F4A7C15) & _MASK_64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK_64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK_64
+    return value ^ (value >> 31)
+
+
+class BloomFilter:
+    """Bloom filter of user ids that uses a fraction of the memory of an IdSet
+
+    Ids that were added are always contained, other ids are contained with a probability of about error_rate
+    as long as at most capacity ids were added. Removed ids stay in the filter and count towards the capacity.
+
+    >>> bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    >>> bloom.add(777000)
+    >>> 777000 in bloom
+    True
+    >>> sum(uid in bloom for uid in range(10_000)) < 300
+    True
+    >>> bloom.nbytes
+    1199
+
+    Args:
+        capacity: Amount of ids the error rate is calculated for
+        error_rate: Probability that an id that wasn't added is contained
+    """
+
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self.removed = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def __len__(self) -> int:
+        """Approximate amount of ids in the filter"""
+        return self.count - self.removed
+
+    def __contains__(self, uid: int) -> bool:
+        bits = self._bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(uid))
+
+    @property
+    def full(self) -> bool:
+        """If more ids than the capacity were added and the error rate is higher than configured"""
+        return self.count > self.capacity
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._bits)
+
+    def add(self, uid: int) -> None:
+        if uid in self:
+            # ids are added again when the reason of a ban changes, don't count them twice
+            return
+        bits = self._bits
+        for pos in self._positions(uid):
+            bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def update(self, uids: Iterable[int]) -> None:
+        """Add ids that are known to be unique, skips the check if they were already added"""
+        bits = self._bits
+        for uid in uids:
+            for pos in self._positions(uid):
+                bits[pos >> 3] |= 1 << (pos & 7)
+            self.count += 1
+
+    def remove(self, uid: int) -> None:
+        """Bits can't be cleared since other ids might share them, the id is only counted as removed"""
+        self.removed += 1
+
+    def _positions(self, uid: int):
+        first = _mix(uid)
+        second = _mix(first) | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
@@ -3,5 +3,8 @@ from .banlist import Banlist
 from .blacklists import Blacklists
 from .bundesnachrichtendienst import Bundesnachrichtendienst
 from .chats import Chats
+from .document_hashes import DocumentHashes
+from .photo_hashes import PhotoHashes
+from .resolved_urls import ResolvedUrls
 from .strafanzeigen import Strafanzeigen
 from .templates import Templates
@@ -1,19 +1,69 @@
-from typing import List, Dict
+import asyncio
+import json
+from array import array
+from typing import List, Dict, Optional, Tuple, Union
 
 from . import AbstractTable
+from ... import Config
+from ..matchers import BloomFilter, IdSet
 from ..types import Chat, BlacklistItem, Template, BannedUser
 
+# the bloom filter has room for this many times the bans it was built with before it is rebuilt
+BLOOM_HEADROOM = 1.5
+
+
 class Banlist(AbstractTable):
-    async def get(self, uid) -> BannedUser:
-        return await self.db.banlist.get_user(uid)
+    """The banlist
+
+    With the banlist_index config option set to `set` the ids of all banned users are kept in memory,
+    so looking up a user that isn't banned doesn't need to query the database. The ids are kept in sync by
+    upsert_multiple, remove and the change notifications sent by the database.
+
+    With `bloom` a bloom filter is used instead which needs less memory but still queries the database
+    for a small fraction of the users that aren't banned.
+    """
+
+    def __init__(self, parent: 'Database'):
+        super().__init__(parent)
+        self._ids: Optional[Union[IdSet, BloomFilter]] = None
+        # changes made while the ids are loaded, they are applied once loading finished
+        self._changes: Optional[List[Tuple[int, bool]]] = None
+        self._reloading = False
+        self._stale = False
+        self.negatives = 0
+        self.false_positives = 0
+
+    async def load(self) -> None:
+        """Load the ids of all banned users into memory if enabled in the config"""
+        if Config().banlist_index == 'none':
+            return
+        # listen first so bans committed while the ids are copied are applied once the copy finished
+        await self.db.listen('banlist', self._changed)
+        await self._reload()
+
+    async def get(self, uid) -> Optional[BannedUser]:
+        if self._ids is None:
+            return await self.db.banlist.get_user(uid)
+        if int(uid) not in self._ids:
+            self.negatives += 1
+            return None
+        user = await self.db.banlist.get_user(uid)
+        if user is None:
+            self.false_positives += 1
+        return user
 
     async def add(self, uid: int, reason: str) -> BannedUser:
         return await self.db.banlist.add_user(uid, reason)
 
     async def remove(self, uid: int) -> None:
-        return await self.db.banlist.remove(uid)
+        await self.db.banlist.remove(uid)
+        self._apply(int(uid), False)
 
     async def get_multiple(self, ids) -> List[BannedUser]:
+        if self._ids is not None:
+            ids = [uid for uid in map(int, ids) if uid in self._ids]
+            if not ids:
+                return []
         return await self.db.banlist.get_multiple(ids)
 
     async def count_reason(self, reason) -> int:
@@ -28,10 +78,89 @@ class Banlist(AbstractTable):
         return await self.db.banlist.total_count()
 
     async def upsert_multiple(self, bans: List[Dict[str, str]]) -> None:
-        return await self.db.banlist.upsert_multiple(bans)
+        await self.db.banlist.upsert_multiple(bans)
+        for ban in bans:
+            self._apply(int(ban['id']), True)
 
     async def get_all(self) -> List[BannedUser]:
         return await self.db.banlist.get_all()
 
     async def get_all_not_in(self, not_in) -> List[BannedUser]:
         return await self.db.banlist.get_all_not_in(not_in)
+
+    def index_stats(self) -> Dict[str, Union[str, int, float]]:
+        """Get the size, memory use and observed false positive rate of the in-memory ids"""
+        stats = {'index': Config().banlist_index}
+        if self._ids is None:
+            return stats
+        stats['ids'] = len(self._ids)
+        stats['memory'] = self._ids.nbytes
+        if isinstance(self._ids, BloomFilter):
+            stats['capacity'] = self._ids.capacity
+            stats['error_rate'] = self._ids.error_rate
+        stats['negatives'] = self.negatives
+        stats['false_positives'] = self.false_positives
+        if self.negatives or self.false_positives:
+            stats['false_positive_rate'] = self.false_positives / (self.negatives + self.false_positives)
+        return stats
+
+    async def _load_ids(self) -> Union[IdSet, BloomFilter]:
+        config = Config()
+        self._changes = []
+        try:
+            if config.banlist_index == 'bloom':
+                capacity = int(await self.db.banlist.total_count() * BLOOM_HEADROOM)
+                index = BloomFilter(max(capacity, 1_000), config.banlist_bloom_error_rate)
+                await self.db.banlist.copy_ids(index.update)
+            else:
+                ids = array('q')
+                await self.db.banlist.copy_ids(ids.extend)
+                index = IdSet.from_sorted(ids)
+            for uid, banned in self._changes:
+                if banned:
+                    index.add(uid)
+                else:
+                    index.remove(uid)
+            return index
+        finally:
+            self._changes = None
+
+    def _apply(self, uid: int, banned: bool) -> None:
+        if self._changes is not None:
+            self._changes.append((uid, banned))
+        if self._ids is not None:
+            if banned:
+                self._ids.add(uid)
+            else:
+                self._ids.remove(uid)
+            if isinstance(self._ids, BloomFilter) and self._ids.full:
+                # the error rate grows once the filter is full, rebuild it with room for the new bans
+                self._ids = None
+                asyncio.ensure_future(self._reload())
+
+    async def _reload(self) -> None:
+        # lookups use the database until the ids are loaded again
+        self._ids = None
+        self._stale = True
+        if self._reloading:
+            return
+        self._reloading = True
+        try:
+            while self._stale:
+                self._stale = False
+                index = await self._load_ids()
+                if not self._stale:
+                    self._ids = index
+        finally:
+            self._reloading = False
+
+    async def _changed(self, payload: Optional[str]) -> None:
+        if payload is None:
+            await self._reload()
+            return
+        change = json.loads(payload)
+        if 'ids' not in change:
+            await self._reload()
+            return
+        for uid in change['ids']:
+            self._apply(uid, change['op'] != 'DELETE')
@@ -1,6 +1,11 @@
-from typing import List
+import abc
+import asyncio
+import json
+from typing import List, Optional, Union
 
 from . import AbstractTable
+from ... import Config
+from ..matchers import AhoCorasick, ExactIndex, HammingIndex, PackedHammingIndex
 from ..types import Chat, BlacklistItem, Template, BannedUser
 from ..errors import ItemDoesNotExistError
 
@@ -12,7 +17,9 @@ class Blacklist(AbstractTable):
         return self.db.blacklists.get(self.hex_type)
 
     async def add(self, item: str) -> BlacklistItem:
-        return await self.bl.add(item)
+        entry = await self.bl.add(item)
+        self._item_added(entry)
+        return entry
 
     async def get_by_value(self, item) -> BlacklistItem:
         return await self.bl.get_by_value(item)
@@ -24,11 +31,13 @@ class Blacklist(AbstractTable):
         result = await self.bl.retire(item)
         if not result:
             raise ItemDoesNotExistError()
+        self._item_retired(value=str(item))
 
     async def retire_by_id(self, id):
         result = await self.bl.retire_by_id(id)
         if not result:
             raise ItemDoesNotExistError()
+        self._item_retired(index=result['id'])
 
     async def get_all(self) -> List[BlacklistItem]:
         return await self.bl.get_all()
@@ -36,36 +45,152 @@ class Blacklist(AbstractTable):
     async def get_indices(self, indices) -> List[BlacklistItem]:
         return await self.bl.get_indices(indices)
 
+    def _item_added(self, item: BlacklistItem) -> None:
+        """Called after an item was added, used by blacklists that keep an in-memory copy"""
 
-class BioBlacklist(Blacklist):
+    def _item_retired(self, index: Optional[int] = None, value: Optional[str] = None) -> None:
+        """Called after items were retired by either their index or their value"""
+
+
+class _IndexedBlacklist(Blacklist):
+    """Blacklist that keeps its active items in an in-memory index
+
+    The index is built from the database on first use and kept in sync by add, retire and the change
+    notifications sent by the database.
+    """
+
+    def __init__(self, parent: 'Database'):
+        super().__init__(parent)
+        self._index = None
+        self._loading: Optional[asyncio.Future] = None
+        self._generation = 0
+
+    @abc.abstractmethod
+    def _new_index(self):
+        """Create an empty index for the items of the blacklist"""
+
+    async def _get_index(self):
+        """Get the index, concurrent callers share a single load of the items"""
+        if self._index is not None:
+            return self._index
+        task = self._loading
+        if task is None:
+            task = self._loading = asyncio.ensure_future(self._load_index())
+            task.add_done_callback(lambda _: setattr(self, '_loading', None))
+        # shield the shared load so a cancelled caller doesn't cancel it for everyone else
+        return await asyncio.shield(task)
+
+    async def _load_index(self):
+        generation = self._generation
+        index = self._new_index()
+        for item in await self.get_all():
+            if not item.retired:
+                index.add(item.value, item.index)
+        # only keep the index if the blacklist didn't change while it was loaded
+        if generation == self._generation:
+            self._index = index
+        return index
+
+    async def load(self) -> None:
+        """Build the index if it wasn't built yet"""
+        await self._get_index()
+
+    def invalidate(self) -> None:
+        """Drop the index so it is rebuilt from the database on the next use"""
+        self._generation += 1
+        self._index = None
+
+    async def refresh(self, index: int) -> None:
+        """Update a single item of the index from the database"""
+        item = await self.get(index)
+        if item is None or item.retired:
+            self._item_retired(index=index)
+        else:
+            self._item_added(item)
+
+    def _item_added(self, item: BlacklistItem) -> None:
+        self._generation += 1
+        if self._index is not None:
+            self._index.add(str(item.value), item.index)
+
+    def _item_retired(self, index: Optional[int] = None, value: Optional[str] = None) -> None:
+        self._generation += 1
+        if self._index is None:
+            return
+        if index is not None:
+            self._index.remove(index)
+        if value is not None:
+            for _index, _value in list(self._index.values.items()):
+                if _value == value:
+                    self._index.remove(_index)
+
+
+class _SubstringBlacklist(_IndexedBlacklist):
+    def _new_index(self) -> AhoCorasick:
+        return AhoCorasick()
+
+    async def match(self, text: str) -> Optional[BlacklistItem]:
+        """Get the active item with the lowest index that is contained in the text"""
+        matcher: AhoCorasick = await self._get_index()
+        index = matcher.search(text)
+        if index is None:
+            return None
+        return BlacklistItem(index, matcher.values[index], False)
+
+
+class BioBlacklist(_SubstringBlacklist):
     hex_type = '0x0'
 
 
-class StringBlacklist(Blacklist):
+class StringBlacklist(_SubstringBlacklist):
     hex_type = '0x1'
 
 
-class ChannelBlacklist(Blacklist):
+class _ExactBlacklist(_IndexedBlacklist):
+    def _new_index(self) -> ExactIndex:
+        return ExactIndex()
+
+    async def get_by_value(self, item) -> Optional[BlacklistItem]:
+        index: ExactIndex = await self._get_index()
+        result = index.search(str(item))
+        if result is None:
+            return None
+        return BlacklistItem(result, index.values[result], False)
+
+
+class ChannelBlacklist(_ExactBlacklist):
     hex_type = '0x3'
 
 
-class DomainBlacklist(Blacklist):
+class DomainBlacklist(_ExactBlacklist):
     hex_type = '0x4'
 
 
-class FileBlacklist(Blacklist):
+class FileBlacklist(_ExactBlacklist):
     hex_type = '0x5'
 
 
-class MHashBlacklist(Blacklist):
+class MHashBlacklist(_IndexedBlacklist):
     hex_type = '0x6'
+    # maximum amount of differing hex digits for a photo hash to be considered similar
+    tolerance = 2
 
+    def _new_index(self) -> Union[HammingIndex, PackedHammingIndex]:
+        if Config().mhash_index == 'numpy':
+            return PackedHammingIndex(self.tolerance)
+        return HammingIndex(self.tolerance)
 
-class TLDBlacklist(Blacklist):
-    hex_type = '0x7'
-
+    async def similar(self, photo_hash: str) -> Optional[BlacklistItem]:
+        """Get the active item with the lowest index that is similar to the photo hash"""
+        index: HammingIndex = await self._get_index()
+        result = index.search(photo_hash)
+        if result is None:
+            return None
+        return BlacklistItem(result, index.values[result], False)
 
 
+class TLDBlacklist(Blacklist):
+    hex_type = '0x7'
 
 
 class Blacklists:
@@ -88,3 +213,24 @@ class Blacklists:
 
     async def get(self, hex_type: str):
         return self._map.get(hex_type)
+
+    @property
+    def generation(self) -> int:
+        """Counter that changes whenever an item of any in-memory blacklist changes"""
+        return sum(blacklist._generation for blacklist in self._map.values())
+
+    async def load(self) -> None:
+        """Load all blacklists into memory and keep them in sync with changes made by other instances"""
+        for blacklist in self._map.values():
+            await blacklist.load()
+        await self.db.listen('blacklists', self._changed)
+
+    async def _changed(self, payload: Optional[str]) -> None:
+        if payload is None:
+            for blacklist in self._map.values():
+                blacklist.invalidate()
+            return
+        change = json.loads(payload)
+        for blacklist in self._map.values():
+            if blacklist.bl.name == change['table']:
+                await blacklist.refresh(change['id'])
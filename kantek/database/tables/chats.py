@@ -1,27 +1,101 @@
-from typing import Dict, Optional
+import dataclasses
+from typing import Dict, Optional, Tuple
 
 from . import AbstractTable
 from ..types import Chat
 
 
 class Chats(AbstractTable):
+    """The settings of chats
+
+    Chats are cached in memory once they were fetched so reading their tags doesn't query the database.
+    Changes are written to the database and the cache at the same time, changes of the settings made by other
+    instances drop the cached chat through the notifications sent by the database. Titles and the sweep progress
+    don't send notifications since they are written often. Every change bumps the version of the
+    chat so a chat fetched while it was changed isn't cached.
+    The returned chats are shared and must not be modified.
+    """
+
+    def __init__(self, parent: 'Database'):
+        super().__init__(parent)
+        self._cache: Dict[int, Chat] = {}
+        self._versions: Dict[int, int] = {}
+        # bumped when all chats are dropped at once
+        self._epoch = 0
+
+    async def load(self) -> None:
+        """Keep the cache in sync with changes made by other instances"""
+        await self.db.listen('chats', self._changed)
+
     async def add(self, chat_id: int, title: Optional[str] = None) -> Chat:
-        return await self.db.chats.add(chat_id, title)
+        chat = await self.db.chats.add(chat_id, title)
+        if chat_id in self._cache:
+            # the chat existed already so only the title changed
+            if title is not None:
+                self._update(chat_id, title=title)
+        else:
+            # the chat might have existed already, it is fetched again on the next use
+            self._invalidate(chat_id)
+        return chat
 
     async def get(self, chat_id: int) -> Chat:
-        return await self.db.chats.get(chat_id)
+        chat = self._cache.get(chat_id)
+        if chat is None:
+            version = self._version(chat_id)
+            chat = await self.db.chats.get(chat_id)
+            # a change made during the fetch might be missing from the fetched chat
+            if chat is not None and version == self._version(chat_id):
+                self._cache[chat_id] = chat
+        return chat
 
     async def lock(self, chat_id: int, permissions: Dict[str, bool]):
         await self.db.chats.lock(chat_id, permissions)
+        self._update(chat_id, locked=True, permissions=permissions)
 
     async def unlock(self, chat_id: int):
         await self.db.chats.unlock(chat_id)
+        self._update(chat_id, locked=False)
 
     async def update_tags(self, chat_id: int, new: Dict):
-        return await self.db.chats.update_tags(chat_id, new)
+        result = await self.db.chats.update_tags(chat_id, new)
+        self._update(chat_id, tags=dict(new))
+        return result
 
     async def start_raid(self, chat_id: int, message_id: int) -> None:
-        return await self.db.chats.start_raid(chat_id, message_id)
+        await self.db.chats.start_raid(chat_id, message_id)
+        self._update(chat_id, raid_start=message_id)
 
     async def stop_raid(self, chat_id: int) -> None:
-        return await self.db.chats.stop_raid(chat_id)
+        await self.db.chats.stop_raid(chat_id)
+        self._update(chat_id, raid_start=None)
+
+    async def update_sweep(self, chat_id: int, offset: int) -> None:
+        """Save how many participants of the chat were checked by the banlist sweep"""
+        await self.db.chats.update_sweep(chat_id, offset)
+        self._update(chat_id, sweep_offset=offset)
+
+    async def finish_sweep(self, chat_id: int) -> None:
+        await self.db.chats.finish_sweep(chat_id)
+        # the time of the sweep is set in the database layer, the chat is fetched again on the next use
+        self._invalidate(chat_id)
+
+    def _version(self, chat_id: int) -> Tuple[int, int]:
+        return self._epoch, self._versions.get(chat_id, 0)
+
+    def _invalidate(self, chat_id: int) -> None:
+        self._versions[chat_id] = self._versions.get(chat_id, 0) + 1
+        self._cache.pop(chat_id, None)
+
+    def _update(self, chat_id: int, **changes) -> None:
+        self._versions[chat_id] = self._versions.get(chat_id, 0) + 1
+        chat = self._cache.get(chat_id)
+        if chat is not None:
+            # replace the chat instead of changing it since it might still be used
+            self._cache[chat_id] = dataclasses.replace(chat, **changes)
+
+    async def _changed(self, payload: Optional[str]) -> None:
+        if payload is None:
+            self._epoch += 1
+            self._cache.clear()
+        else:
+            self._invalidate(int(payload))
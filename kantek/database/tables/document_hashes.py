@@ -0,0 +1,29 @@
+import time
+from typing import Optional
+
+from . import AbstractTable
+
+# hashes are kept for this many seconds, spam is usually only sent for a few days
+DOCUMENT_HASH_RETENTION = 30 * 24 * 60 * 60
+# seconds between two cleanups, the cleanup is requested for every message
+DOCUMENT_HASH_CLEANUP_INTERVAL = 60 * 60
+
+
+class DocumentHashes(AbstractTable):
+    def __init__(self, parent: 'Database'):
+        super().__init__(parent)
+        self._last_cleanup: Optional[float] = None
+
+    async def get(self, document_id: int) -> Optional[str]:
+        return await self.db.document_hashes.get(document_id)
+
+    async def add(self, document_id: int, file_hash: str) -> None:
+        return await self.db.document_hashes.add(document_id, file_hash)
+
+    async def cleanup(self) -> None:
+        """Delete old hashes, runs at most once per cleanup interval"""
+        now = time.monotonic()
+        if self._last_cleanup is not None and now - self._last_cleanup < DOCUMENT_HASH_CLEANUP_INTERVAL:
+            return
+        self._last_cleanup = now
+        await self.db.document_hashes.cleanup(DOCUMENT_HASH_RETENTION)
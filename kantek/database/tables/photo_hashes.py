@@ -0,0 +1,11 @@
+from typing import Optional
+
+from . import AbstractTable
+
+
+class PhotoHashes(AbstractTable):
+    async def get(self, photo_id: int, dc_id: int) -> Optional[str]:
+        return await self.db.photo_hashes.get(photo_id, dc_id)
+
+    async def add(self, photo_id: int, dc_id: int, photo_hash: str) -> None:
+        return await self.db.photo_hashes.add(photo_id, dc_id, photo_hash)
@@ -5,4 +5,7 @@ from .chats import Chats
 from .strafanzeigen import Strafanzeigen
 from .templates import Templates
 from .bundesnachrichtendienst import Bundesnachrichtendienst
+from .resolved_urls import ResolvedUrls
+from .photo_hashes import PhotoHashes
+from .document_hashes import DocumentHashes
 from .postgres_wrapper import PostgresWrapper
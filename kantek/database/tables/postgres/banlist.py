@@ -1,5 +1,5 @@
 import datetime
-from typing import Dict, Optional, List
+from typing import Any, Callable, Dict, Optional, List
 from . import AbstractTableWrapper
 from ...types import Chat, BlacklistItem, Template, BannedUser
 
@@ -64,6 +64,21 @@ class Banlist(AbstractTableWrapper):
             rows = await conn.fetch('SELECT * FROM banlist')
         return [BannedUser(row['id'], row['reason']) for row in rows]
 
+    async def copy_ids(self, sink: Callable[[List[int]], Any]) -> None:
+        """Stream the ids of all banned users in ascending order to the sink in chunks using COPY"""
+        rest = b''
+
+        async def _output(data: bytes) -> None:
+            nonlocal rest
+            lines = (rest + data).split(b'\n')
+            rest = lines.pop()
+            sink([int(line) for line in lines])
+
+        async with self.pool.acquire() as conn:
+            await conn.copy_from_query('SELECT id FROM banlist ORDER BY id', output=_output)
+        if rest:
+            sink([int(rest)])
+
     async def get_all_not_in(self, not_in) -> List[BannedUser]:
         not_in = list(map(int, not_in))
         async with self.pool.acquire() as conn:
@@ -1,3 +1,4 @@
+import datetime
 import json
 from typing import Dict, Optional
 
@@ -28,6 +29,8 @@ class Chats(AbstractTableWrapper):
                 permissions=json.loads(row['permissions'] or '{}'),
                 locked=row['locked'],
                 raid_start=row['raid_start'],
+                last_sweep=row['last_sweep'],
+                sweep_offset=row['sweep_offset'],
             )
 
     async def lock(self, chat_id: int, permissions: Dict[str, bool]) -> None:
@@ -50,3 +53,12 @@ class Chats(AbstractTableWrapper):
     async def stop_raid(self, chat_id: int) -> None:
         async with self.pool.acquire() as conn:
             await conn.execute("UPDATE chats SET raid_start = NULL WHERE id = $1", chat_id)
+
+    async def update_sweep(self, chat_id: int, offset: int) -> None:
+        async with self.pool.acquire() as conn:
+            await conn.execute("UPDATE chats SET sweep_offset = $2 WHERE id = $1", chat_id, offset)
+
+    async def finish_sweep(self, chat_id: int) -> None:
+        async with self.pool.acquire() as conn:
+            await conn.execute("UPDATE chats SET sweep_offset = 0, last_sweep = $2 WHERE id = $1",
+                               chat_id, datetime.datetime.now())
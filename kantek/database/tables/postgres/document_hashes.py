@@ -0,0 +1,21 @@
+from typing import Optional
+
+from . import AbstractTableWrapper
+
+
+class DocumentHashes(AbstractTableWrapper):
+    async def get(self, document_id: int) -> Optional[str]:
+        async with self.pool.acquire() as conn:
+            return await conn.fetchval("SELECT hash FROM document_hashes WHERE document_id = $1", document_id)
+
+    async def add(self, document_id: int, file_hash: str) -> None:
+        async with self.pool.acquire() as conn:
+            await conn.execute("""
+                INSERT INTO document_hashes
+                VALUES ($1, $2)
+                ON CONFLICT DO NOTHING
+            """, document_id, file_hash)
+
+    async def cleanup(self, max_age: float) -> None:
+        async with self.pool.acquire() as conn:
+            await conn.execute("DELETE FROM document_hashes WHERE added < now() - make_interval(secs => $1)", max_age)
@@ -0,0 +1,18 @@
+from typing import Optional
+
+from . import AbstractTableWrapper
+
+
+class PhotoHashes(AbstractTableWrapper):
+    async def get(self, photo_id: int, dc_id: int) -> Optional[str]:
+        async with self.pool.acquire() as conn:
+            return await conn.fetchval("SELECT hash FROM photo_hashes WHERE photo_id = $1 AND dc_id = $2",
+                                       photo_id, dc_id)
+
+    async def add(self, photo_id: int, dc_id: int, photo_hash: str) -> None:
+        async with self.pool.acquire() as conn:
+            await conn.execute("""
+                INSERT INTO photo_hashes
+                VALUES ($1, $2, $3)
+                ON CONFLICT DO NOTHING
+            """, photo_id, dc_id, photo_hash)
@@ -1,11 +1,21 @@
 """Module containing all operations related to PostgreSQL"""
+import asyncio
 import datetime
 import json
+import logging
 import re
+from typing import Awaitable, Callable, Dict, List, Optional
 
 import asyncpg as asyncpg
+import logzero
+from asyncpg import Connection
 from asyncpg.pool import Pool
-from . import Banlist, Blacklists, Chats, Strafanzeigen, Templates, Bundesnachrichtendienst
+from . import (Banlist, Blacklists, Chats, Strafanzeigen, Templates, Bundesnachrichtendienst, ResolvedUrls,
+               PhotoHashes, DocumentHashes)
+
+logger: logging.Logger = logzero.logger
+
+NotificationCallback = Callable[[Optional[str]], Awaitable[None]]
 
 
 class PostgresWrapper:  # pylint: disable = R0902
@@ -14,8 +24,11 @@ class PostgresWrapper:  # pylint: disable = R0902
     async def connect(self, host, port, username, password, name) -> None:
         if port is None:
             port = 5432
-        self.pool: Pool = await asyncpg.create_pool(user=username, password=password,
-                                                    database=name, host=host, port=port)
+        self._connect_kwargs = dict(user=username, password=password, database=name, host=host, port=port)
+        self._listener: Optional[Connection] = None
+        self._listeners: Dict[str, List[NotificationCallback]] = {}
+        self._closing = False
+        self.pool: Pool = await asyncpg.create_pool(**self._connect_kwargs)
 
         self.chats: Chats = Chats(self.pool)
         self.blacklists = Blacklists(self.pool)
@@ -23,9 +36,58 @@ class PostgresWrapper:  # pylint: disable = R0902
         self.strafanzeigen: Strafanzeigen = Strafanzeigen(self.pool)
         self.templates: Templates = Templates(self.pool)
         self.bundesnachrichtendienst: Bundesnachrichtendienst = Bundesnachrichtendienst(self.pool)
+        self.resolved_urls: ResolvedUrls = ResolvedUrls(self.pool)
+        self.photo_hashes: PhotoHashes = PhotoHashes(self.pool)
+        self.document_hashes: DocumentHashes = DocumentHashes(self.pool)
 
     async def disconnect(self):
+        self._closing = True
+        if self._listener is not None:
+            await self._listener.close()
         await self.pool.close()
 
+    async def listen(self, channel: str, callback: NotificationCallback) -> None:
+        """Call the callback with the payload of every notification sent on the channel
+
+        Notifications are received on a dedicated connection. If that connection is lost it is reestablished
+        and the callback is called with None since notifications might have been missed in the meantime.
+        """
+        if self._listener is None:
+            await self._connect_listener()
+        callbacks = self._listeners.setdefault(channel, [])
+        if not callbacks:
+            await self._listener.add_listener(channel, self._notify)
+        callbacks.append(callback)
+
+    async def _connect_listener(self) -> None:
+        self._listener = await asyncpg.connect(**self._connect_kwargs)
+        self._listener.add_termination_listener(self._listener_terminated)
+
+    def _listener_terminated(self, connection: Connection) -> None:
+        if not self._closing:
+            logger.warning('Lost the connection for database notifications, reconnecting')
+            asyncio.ensure_future(self._reconnect_listener())
+
+    async def _reconnect_listener(self) -> None:
+        while not self._closing:
+            try:
+                await self._connect_listener()
+                break
+            except (OSError, asyncpg.PostgresError) as err:
+                logger.error(err)
+                await asyncio.sleep(5)
+        if self._closing:
+            return
+        for channel in self._listeners:
+            await self._listener.add_listener(channel, self._notify)
+            await self._notify(self._listener, None, channel, None)
+
+    async def _notify(self, connection: Connection, pid: Optional[int], channel: str, payload: Optional[str]) -> None:
+        for callback in self._listeners.get(channel, []):
+            try:
+                await callback(payload)
+            except Exception as err:  # pylint: disable = W0703
+                logger.exception(err)
+
     def convert_wildcard(self, query):
         return re.sub(r'(?<!\\)\*', self.wildcard, query)
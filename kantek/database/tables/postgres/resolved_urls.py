@@ -0,0 +1,31 @@
+from typing import Optional
+
+from . import AbstractTableWrapper
+from ...types import ResolvedUrl
+
+
+class ResolvedUrls(AbstractTableWrapper):
+    async def get(self, url: str) -> Optional[ResolvedUrl]:
+        async with self.pool.acquire() as conn:
+            # the expiry is only compared with the time of the database so it doesn't depend on the local timezone
+            row = await conn.fetchrow("""
+                SELECT url, resolved, extract(epoch FROM expires - now())::float AS ttl
+                FROM resolved_urls WHERE url = $1 AND expires > now()
+            """, url)
+        if row:
+            return ResolvedUrl(row['url'], row['resolved'], row['ttl'])
+        else:
+            return None
+
+    async def add(self, url: str, resolved: Optional[str], ttl: float) -> None:
+        async with self.pool.acquire() as conn:
+            await conn.execute("""
+                INSERT INTO resolved_urls
+                VALUES ($1, $2, now() + make_interval(secs => $3))
+                ON CONFLICT (url) DO UPDATE
+                SET resolved=excluded.resolved, expires=excluded.expires
+            """, url, resolved, expires)
+
+    async def cleanup(self) -> None:
+        async with self.pool.acquire() as conn:
+            await conn.execute("DELETE FROM resolved_urls WHERE expires < now()")
@@ -0,0 +1,15 @@
+from typing import Optional
+
+from . import AbstractTable
+from ..types import ResolvedUrl
+
+
+class ResolvedUrls(AbstractTable):
+    async def get(self, url: str) -> Optional[ResolvedUrl]:
+        return await self.db.resolved_urls.get(url)
+
+    async def add(self, url: str, resolved: Optional[str], ttl: float) -> None:
+        return await self.db.resolved_urls.add(url, resolved, ttl)
+
+    async def cleanup(self) -> None:
+        await self.db.resolved_urls.cleanup()
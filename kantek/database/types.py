@@ -1,4 +1,5 @@
 from dataclasses import dataclass, field
+from datetime import datetime
 from enum import Enum
 from typing import Dict, Optional
 
@@ -18,6 +19,8 @@ class Chat:
     permissions: Dict[str, bool] = field(default_factory=lambda: {})
     locked: bool = False
     raid_start: int = None
+    last_sweep: Optional[datetime] = None
+    sweep_offset: int = 0
 
 
 @dataclass
@@ -26,6 +29,14 @@ class BannedUser:
     reason: str
 
 
+@dataclass
+class ResolvedUrl:
+    url: str
+    resolved: Optional[str]
+    # seconds until the entry expires
+    ttl: float
+
+
 @dataclass
 class Template:
     name: str
@@ -3,7 +3,6 @@ from datetime import timedelta
 
 from telethon.errors import ChatNotModifiedError
 from telethon.tl.custom import Message
-from telethon.tl.functions.channels import GetParticipantRequest
 from telethon.tl.functions.messages import EditChatDefaultBannedRightsRequest
 from telethon.tl.types import ChatBannedRights, Chat, ChannelParticipantCreator, ChannelParticipantAdmin
 
@@ -31,7 +30,7 @@ async def lock(client: Client, db: Database, chat: Chat, event: Command, msg: Me
         {cmd} 1d
         {cmd}
     """
-    participant = (await client(GetParticipantRequest(chat, msg.sender_id))).participant
+    participant = await client.get_admin(chat, msg.sender_id)
     permitted = False
     if isinstance(participant, ChannelParticipantCreator):
         permitted = True
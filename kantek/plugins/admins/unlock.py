@@ -2,7 +2,6 @@ import logging
 
 from telethon.errors import ChatNotModifiedError
 from telethon.tl.custom import Message
-from telethon.tl.functions.channels import GetParticipantRequest
 from telethon.tl.functions.messages import EditChatDefaultBannedRightsRequest
 from telethon.tl.types import ChatBannedRights, ChannelParticipantCreator, ChannelParticipantAdmin
 
@@ -24,7 +23,7 @@ async def unlock(client: Client, db: Database, chat, event: Command, msg: Messag
     Examples:
         {cmd}
     """
-    participant = (await client(GetParticipantRequest(chat, msg.sender_id))).participant
+    participant = await client.get_admin(chat, msg.sender_id)
     permitted = False
     if isinstance(participant, ChannelParticipantCreator):
         permitted = True
@@ -126,11 +126,15 @@ async def add(client: Client, db: Database, msg: Message, args,
             reply_msg: Message = await msg.get_reply_message()
             if reply_msg.file:
                 await msg.edit('Downloading file, this may take a while.')
-
-                file = await reply_msg.download_media(
-                    bytes,
-                    progress_callback=lambda r, t: _sync_file_callback(r, t, msg))
-                file_hash = helpers.hash_file(file)
+                if reply_msg.document:
+                    file_hash = await client.hash_document(
+                        reply_msg.document,
+                        progress_callback=lambda r, t: _sync_file_callback(r, t, msg))
+                else:
+                    file = await reply_msg.download_media(
+                        bytes,
+                        progress_callback=lambda r, t: _sync_file_callback(r, t, msg))
+                    file_hash = helpers.hash_file(file)
                 await msg.delete()
                 existing_one = await blacklist.get_by_value(file_hash)
 
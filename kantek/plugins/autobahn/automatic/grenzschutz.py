@@ -1,27 +1,29 @@
 import logging
-from typing import Union
+from typing import List, Optional, Tuple, Union
 
 import logzero
 from telethon import events
 from telethon.errors import UserIdInvalidError, ChannelPrivateError
 from telethon.events import ChatAction, NewMessage
-from telethon.tl.types import (Channel, ChannelParticipantsAdmins, MessageActionChatJoinedByLink,
+from telethon.tl.types import (Channel, MessageActionChatJoinedByLink,
                                MessageActionChatAddUser, PeerUser, Message, )
 from telethon.utils import get_display_name
 
-from kantek import Database
 from kantek import Client
+from kantek.database import BannedUser
+from kantek.utils.batching import Batcher
 from kantek.utils.constants import GET_ENTITY_ERRORS
+from kantek.utils.context import UpdateContext
 from kantex.md import *
-from kantek.utils.pluginmgr import k
-from kantek.utils.tags import Tags
+from kantek.utils.pluginmgr import k, Priority
 
 tlog = logging.getLogger('kantek-channel-log')
 logger: logging.Logger = logzero.logger
 
 
-@k.event(events.chataction.ChatAction())
-@k.event(events.NewMessage(), name='grenzschutz')
+# only joins are queued at high priority, the other chat actions would make the high priority queue unbounded
+@k.event(events.chataction.ChatAction(func=lambda e: e.user_joined or e.user_added), priority=Priority.HIGH)
+@k.event(events.NewMessage(), name='grenzschutz', priority=Priority.NORMAL)
 async def grenzschutz(event: Union[ChatAction.Event, NewMessage.Event]) -> None:  # pylint: disable = R0911
     """Automatically ban gbanned users.
 
@@ -47,63 +49,101 @@ async def grenzschutz(event: Union[ChatAction.Event, NewMessage.Event]) -> None:
         elif not isinstance(event.action_message.action,
                             (MessageActionChatJoinedByLink, MessageActionChatAddUser)):
             return
-    client: Client = event.client
-    try:
-        chat: Channel = await event.get_chat()
-    except ChannelPrivateError:
-        return
-    if not chat.creator and not chat.admin_rights:
+    if isinstance(event, ChatAction.Event):
+        # users joining during a raid are checked together
+        _joins.add(event.chat_id, event, event.client.plugin_mgr.scheduler)
         return
-    if chat.admin_rights:
-        if not chat.admin_rights.ban_users:
-            return
-    db: Database = client.db
-    tags = await Tags.from_event(event)
-    polizei_tag = tags.get('polizei')
-    grenzschutz_tag = tags.get('grenzschutz')
-    silent = grenzschutz_tag == 'silent'
-    if grenzschutz_tag == 'exclude' or polizei_tag == 'exclude':
+
+    client: Client = event.client
+    context: UpdateContext = event.context
+    settings = await _get_settings(context)
+    if settings is None:
         return
+    chat, silent = settings
 
-    if isinstance(event, ChatAction.Event):
-        uid = event.user.id
-    elif isinstance(event, NewMessage.Event):
-        user = event.message.sender_id
-        if isinstance(user, PeerUser):
-            uid = user.user_id
-        else:
-            return
+    user = event.message.sender_id
+    if isinstance(user, PeerUser):
+        uid = user.user_id
     else:
         return
 
     if uid is None:
         return
-    try:
-        entity = await client.get_entity(uid)
-        name = get_display_name(entity)
-    except GET_ENTITY_ERRORS:
-        name = uid
 
-    result = await db.banlist.get(uid)
+    result = await context.ban(uid)
     if not result:
         return
-    else:
-        ban_reason = result.reason
-    admins = [p.id for p in await client.get_participants(event.chat_id, filter=ChannelParticipantsAdmins())]
-    if uid not in admins:
-        try:
-            await client.ban(chat, uid)
-        except UserIdInvalidError as err:
-            logger.error("Error occured while banning %s", err)
+    if not await context.is_admin(uid):
+        if not await _ban(client, chat, uid):
             return
         await event.delete()
         if not silent:
-            message = KanTeXDocument(Section(
-                Bold('SpamWatch Grenzschutz Ban'),
-                KeyValueItem(Bold("User"),
-                             f'{Mention(name, uid)} [{Code(uid)}]'),
-                KeyValueItem(Bold("Reason"),
-                             ban_reason)
-            ))
-            delete_time = '2m30s' if 'kriminalamt' not in ban_reason.lower() else '10s'
-            await client.respond(event, str(message), reply=False, delete=delete_time)
+            await _notify(event, [result])
+
+
+async def _check_joins(chat_id: int, joins: List[ChatAction.Event]) -> None:
+    """Ban all gbanned users of a batch of joins with a single banlist query"""
+    client: Client = joins[0].client
+    context: UpdateContext = joins[0].context
+    settings = await _get_settings(context)
+    if settings is None:
+        return
+    chat, silent = settings
+
+    join_events = {uid: join for join in joins for uid in join.user_ids if uid is not None}
+    banned = []
+    for result in await client.db.banlist.get_multiple(list(join_events)):
+        if await context.is_admin(result.id):
+            continue
+        if await _ban(client, chat, result.id):
+            await join_events[result.id].delete()
+            banned.append(result)
+    if banned and not silent:
+        await _notify(joins[-1], banned)
+
+
+_joins = Batcher(_check_joins, priority=Priority.HIGH)
+
+
+async def _get_settings(context: UpdateContext) -> Optional[Tuple[Channel, bool]]:
+    """Get the chat and if bans should be silent or None if grenzschutz shouldn't ban in the chat"""
+    try:
+        chat: Channel = await context.chat()
+    except ChannelPrivateError:
+        return None
+    if not chat.creator and not chat.admin_rights:
+        return None
+    if chat.admin_rights:
+        if not chat.admin_rights.ban_users:
+            return None
+    tags = await context.tags()
+    polizei_tag = tags.get('polizei')
+    grenzschutz_tag = tags.get('grenzschutz')
+    if grenzschutz_tag == 'exclude' or polizei_tag == 'exclude':
+        return None
+    return chat, grenzschutz_tag == 'silent'
+
+
+async def _ban(client: Client, chat: Channel, uid: int) -> bool:
+    try:
+        await client.ban(chat, uid)
+    except UserIdInvalidError as err:
+        logger.error("Error occured while banning %s", err)
+        return False
+    return True
+
+
+async def _notify(event: Union[ChatAction.Event, NewMessage.Event], bans: List[BannedUser]) -> None:
+    client: Client = event.client
+    sec = Section(Bold('SpamWatch Grenzschutz Ban'))
+    for ban in bans:
+        try:
+            entity = await client.get_entity(ban.id)
+            name = get_display_name(entity)
+        except GET_ENTITY_ERRORS:
+            name = ban.id
+        sec.append(KeyValueItem(Bold("User"), f'{Mention(name, ban.id)} [{Code(ban.id)}]'))
+        sec.append(KeyValueItem(Bold("Reason"), ban.reason))
+    kriminalamt = all('kriminalamt' in ban.reason.lower() for ban in bans)
+    delete_time = '2m30s' if not kriminalamt else '10s'
+    await client.respond(event, str(KanTeXDocument(sec)), reply=False, delete=delete_time)
@@ -1,23 +1,29 @@
 import asyncio
 import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Set
 
 import logzero
 from telethon import events
-from telethon.errors import UserNotParticipantError
 from telethon.events import ChatAction
-from telethon.tl.functions.channels import (DeleteUserHistoryRequest,
-                                            GetParticipantRequest)
-from telethon.tl.types import (Channel, User, ChannelAdminLogEventActionParticipantLeave,
+from telethon.tl.functions.channels import DeleteUserHistoryRequest
+from telethon.tl.types import (Channel, ChannelAdminLogEventActionParticipantLeave,
                                ChannelAdminLogEventActionParticipantJoin)
 
 from kantek import Client
-from kantek.utils.constants import GET_ENTITY_ERRORS
-from kantek.utils.pluginmgr import k
-from kantek.utils.tags import Tags
+from kantek.utils.batching import Batcher
+from kantek.utils.context import UpdateContext
+from kantek.utils.pluginmgr import k, Priority
 
 tlog = logging.getLogger('kantek-channel-log')
 logger: logging.Logger = logzero.logger
 
+# users leaving within this many seconds after joining are banned
+DELAY = 1
+
+# extra seconds of the admin log that are searched in case the clocks differ
+ADMIN_LOG_MARGIN = 60
+
 
 @k.event(events.chataction.ChatAction(), name='kriminalamt')
 async def kriminalamt(event: ChatAction.Event) -> None:
@@ -30,40 +36,55 @@ async def kriminalamt(event: ChatAction.Event) -> None:
     Tags:
         `-kriminalamt`: If kriminalamt should run or not
     """
-    client: Client = event.client
-    chat: Channel = await event.get_chat()
-    user: User = await event.get_user()
-    tags = await Tags.from_event(event)
+    if not event.user_joined:
+        return
+    # users joining during a raid are checked together
+    _joins.add(event.chat_id, event, event.client.plugin_mgr.scheduler)
+
+
+async def _check_joins(chat_id: int, joins: List[ChatAction.Event]) -> None:
+    """Check which users of a batch of joins left again with a single pass over the admin log"""
+    client: Client = joins[0].client
+    context: UpdateContext = joins[0].context
+    chat: Channel = await context.chat()
+    tags = await context.tags()
     enabled = tags.get('kriminalamt', False)
     bancmd = tags.get('gbancmd', 'manual')
-    delay = 1
-    if not event.user_joined or not (chat.creator or chat.admin_rights):
+    if not enabled or not (chat.creator or chat.admin_rights):
         return
 
-    if not enabled or user.bot:
+    join_events: Dict[int, ChatAction.Event] = {}
+    for join in joins:
+        for user in await join.get_users():
+            if user is not None and not user.bot:
+                join_events[user.id] = join
+    if not join_events:
         return
 
-    await asyncio.sleep(delay)
+    # only the part of the admin log since the batch started needs to be searched
+    since = datetime.now(timezone.utc) - timedelta(seconds=_joins.window + ADMIN_LOG_MARGIN)
+    await asyncio.sleep(DELAY)
 
-    try:
-        await client(GetParticipantRequest(chat, user))
-    except GET_ENTITY_ERRORS:
-        return
-    except UserNotParticipantError:
-        userid = event.user.id
-        leave_event = None
-        async for e in client.iter_admin_log(chat, join=True, leave=True):
-            if e.user_id == userid:
-                if isinstance(e.action, ChannelAdminLogEventActionParticipantLeave):
-                    leave_event = e
-                elif isinstance(e.action, ChannelAdminLogEventActionParticipantJoin):
-                    if leave_event and e.date < leave_event.date:
-                        diff = leave_event.date - e.date
-                        if diff.seconds > delay:
-                            return
-        if leave_event is None:
-            return
-        reason = f'Kriminalamt #{chat.id} No. {delay}'
+    leaves: Dict[int, datetime] = {}
+    checked: Set[int] = set()
+    bots: List[int] = []
+    async for e in client.iter_admin_log(chat, join=True, leave=True):
+        if e.date < since or len(checked) == len(join_events):
+            break
+        uid = e.user_id
+        if uid not in join_events or uid in checked:
+            continue
+        # the log is iterated from the newest entry, a join without a later leave means the user is still in the chat
+        if isinstance(e.action, ChannelAdminLogEventActionParticipantLeave):
+            leaves.setdefault(uid, e.date)
+        elif isinstance(e.action, ChannelAdminLogEventActionParticipantJoin):
+            checked.add(uid)
+            if uid in leaves and (leaves[uid] - e.date).total_seconds() <= DELAY:
+                bots.append(uid)
+
+    for userid in bots:
+        event = join_events[userid]
+        reason = f'Kriminalamt #{chat.id} No. {DELAY}'
         await client.gban(userid, reason)
         if bancmd == 'manual':
             await client.ban(chat, userid)
@@ -76,3 +97,6 @@ async def kriminalamt(event: ChatAction.Event) -> None:
             await client(DeleteUserHistoryRequest(chat, userid))
         else:
             await event.delete()
+
+
+_joins = Batcher(_check_joins, priority=Priority.HIGH)
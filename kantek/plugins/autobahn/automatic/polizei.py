@@ -1,33 +1,76 @@
 import asyncio
+import functools
+import hashlib
 import itertools
 import logging
+from enum import IntEnum
+from typing import Awaitable, Callable, Dict, Hashable, List, NamedTuple, Optional, Tuple
 
 import logzero
 from PIL import UnidentifiedImageError
-from photohash import hashes_are_similar
 from telethon import events
-from telethon.errors import UserNotParticipantError, ChannelPrivateError, FloodWaitError
+from telethon.errors import ChannelPrivateError, FloodWaitError
 from telethon.events import ChatAction, NewMessage
 from telethon.tl.custom import Message
 from telethon.tl.custom import MessageButton
-from telethon.tl.functions.channels import DeleteUserHistoryRequest, GetParticipantRequest
-from telethon.tl.functions.users import GetFullUserRequest
-from telethon.tl.types import (Channel, MessageEntityTextUrl, UserFull, MessageEntityUrl,
-                               MessageEntityMention, ChannelParticipantsAdmins, ChannelParticipantAdmin, PeerUser, )
+from telethon.tl.functions.channels import DeleteUserHistoryRequest
+from telethon.tl.types import (Channel, MessageEntityTextUrl, MessageEntityUrl,
+                               MessageEntityMention, PeerUser, )
+from yarl import URL
 
 from kantek import Database
-from kantek.utils import helpers, constants
+from kantek.database import BlacklistItem
+from kantek.utils import helpers, constants, urls
 from kantek import Client
+from kantek.utils.batching import Batcher
+from kantek.utils.cache import TTLCache
+from kantek.utils.client import FullUser
 from kantek.utils.constants import GET_ENTITY_ERRORS
+from kantek.utils.context import UpdateContext
 from kantek.utils.helpers import hash_photo
-from kantek.utils.pluginmgr import k
+from kantek.utils.pluginmgr import k, Priority
 from kantek.utils.tags import Tags
 
 tlog = logging.getLogger('kantek-channel-log')
 logger: logging.Logger = logzero.logger
 
+# blacklist type and index of the matched item
+Verdict = Optional[Tuple[str, int]]
 
-@k.event(events.MessageEdited(outgoing=False))
+
+class Cost(IntEnum):
+    """How expensive the checks of a stage are, cheaper stages run first"""
+    CPU = 0
+    DB = 1
+    NETWORK = 2
+    MEDIA = 3
+
+
+class Stage(NamedTuple):
+    """A group of checks that is run as one step of _check_message"""
+    name: str
+    cost: Cost
+    check: Callable[[Client, Message], Awaitable[Verdict]]
+
+
+# documents are only downloaded once so they can be larger than what would be reasonable to download for every message
+MAX_FILE_SIZE = (1024 ** 2) * 20
+
+# maximum amount of links and entities of a message or joined users that are checked at the same time
+MAX_CONCURRENT_CHECKS = 8
+
+# spambots post the same message in many chats at once, copies of it are only checked once
+_message_verdicts = TTLCache(maxsize=10_000, ttl=60)
+_checking_messages: Dict[Hashable, asyncio.Future] = {}
+
+# fingerprints of checked messages by chat and message id
+_checked_messages = TTLCache(maxsize=50_000, ttl=24 * 60 * 60)
+
+# users joining multiple chats during a join wave are only checked once as long as the blacklists don't change
+_join_verdicts = TTLCache(maxsize=10_000, ttl=10 * 60)
+
+
+@k.event(events.MessageEdited(outgoing=False), priority=Priority.LOW)
 @k.event(events.NewMessage(outgoing=False), name='polizei')
 async def polizei(event: NewMessage.Event) -> None:
     """Checks every message against the autobahn blacklists and bans a user if necessary
@@ -39,26 +82,33 @@ async def polizei(event: NewMessage.Event) -> None:
     Tags:
         polizei:
             exclude: Messages won't be checked
+        polizei_stages:
+            [inline_bot, string, domain, file_id, links, file, photo]: Only run these checks in this order
     """
     if event.is_private:
         return
-    client: Client = event.client
+    # edits that only change things like reactions or the link preview don't need to be checked again
+    fingerprint = _fingerprint(event.message)
+    checked = (event.chat_id, event.message.id)
+    if isinstance(event, events.MessageEdited.Event) and _checked_messages.get(checked) == fingerprint:
+        return
+    context: UpdateContext = event.context
     try:
-        chat: Channel = await event.get_chat()
+        chat: Channel = await context.chat()
     except ChannelPrivateError:
         return
     if chat.broadcast:
         return
-    tags = await Tags.from_event(event)
+    tags = await context.tags()
     bancmd = tags.get('gbancmd', 'manual')
     polizei_tag = tags.get('polizei')
     if polizei_tag == 'exclude':
         return
-    ban_type, ban_reason = await _check_message(event)
+    ban_type, ban_reason = await _check_message(event, _get_stages(tags), fingerprint)
+    _checked_messages.set(checked, fingerprint)
     if ban_type and ban_reason:
         uid = event.message.sender_id
-        admins = [p.id for p in await client.get_participants(event.chat_id, filter=ChannelParticipantsAdmins())]
-        if uid not in admins:
+        if not await context.is_admin(uid):
             await _banuser(event, uid, bancmd, ban_type, ban_reason)
 
 
@@ -68,56 +118,82 @@ async def join_polizei(event: ChatAction.Event) -> None:
     # avoid flood waits from chats mass adding users and don't check users leaving
     if not event.user_joined:
         return
-    client: Client = event.client
+    # users joining during a raid are checked together
+    _joins.add(event.chat_id, event, event.client.plugin_mgr.scheduler)
+
+
+async def _check_joins(chat_id: int, joins: List[ChatAction.Event]) -> None:
+    client: Client = joins[0].client
+    context: UpdateContext = joins[0].context
     try:
-        chat: Channel = await event.get_chat()
+        await context.chat()
     except ChannelPrivateError:
         return
-    db: Database = client.db
-    tags = await Tags.from_event(event)
+    tags = await context.tags()
     bancmd = tags.get('gbancmd')
     polizei_tag = tags.get('polizei')
     if polizei_tag == 'exclude':
         return
-    ban_type, ban_reason = False, False
-    bio_blacklist = await db.blacklists.bio.get_all()
-    mhash_blacklist = await db.blacklists.mhash.get_all()
 
-    try:
-        user: UserFull = await client(GetFullUserRequest(await event.get_input_user()))
-    except TypeError as e:
-        logger.error(e)
-        return
+    generation = client.db.blacklists.generation
+    join_events = {}
+    unchecked = []
+    for join in joins:
+        for user in await join.get_input_users():
+            if user is None:
+                continue
+            uid = await client.get_peer_id(user)
+            if uid not in join_events and _join_verdicts.get((generation, uid)) is None:
+                unchecked.append(user)
+            join_events[uid] = join
+    full_users = await client.get_full_users(unchecked)
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_CHECKS)
+
+    async def _get_verdict(uid: int, verdict):
+        if verdict is None:
+            async with semaphore:
+                verdict = await _check_user(client, full_users[uid])
+            _join_verdicts.set((generation, uid), verdict)
+        return verdict
+
+    # the cached verdicts are only looked up once so they can't expire between the lookup and the check
+    cached = {uid: _join_verdicts.get((generation, uid)) for uid in join_events}
+    uids = [uid for uid, verdict in cached.items() if verdict is not None or uid in full_users]
+    verdicts = await asyncio.gather(*[_get_verdict(uid, cached[uid]) for uid in uids])
+    for uid, (ban_type, ban_reason) in zip(uids, verdicts):
+        if ban_type and ban_reason:
+            await _banuser(join_events[uid], uid, bancmd, ban_type, ban_reason)
+
+
+_joins = Batcher(_check_joins, priority=Priority.HIGH)
+
+
+async def _check_user(client: Client, user: FullUser):
+    db: Database = client.db
 
-    for item in bio_blacklist:
-        if user.about and item.value in user.about and not item.retired:
-            ban_type, ban_reason = db.blacklists.bio.hex_type, item.index
+    if user.about:
+        result = await db.blacklists.bio.match(user.about)
+        if result:
+            return db.blacklists.bio.hex_type, result.index
 
     if user.profile_photo:
-        try:
-            dl_photo = await client.download_file(user.profile_photo)
-        except constants.DOWNLOAD_ERRORS:
-            dl_photo = None
-        if dl_photo:
-            photo_hash = await hash_photo(dl_photo)
-
-            for mhash in mhash_blacklist:
-                if mhash and not mhash.retired:
-                    if hashes_are_similar(mhash.value, photo_hash, tolerance=2):
-                        ban_type, ban_reason = db.blacklists.mhash.hex_type, mhash.index
+        photo_hash = await client.hash_profile_photo(user.profile_photo)
+        if photo_hash:
+            result = await db.blacklists.mhash.similar(photo_hash)
+            if result:
+                return db.blacklists.mhash.hex_type, result.index
 
-    if ban_type and ban_reason:
-        await _banuser(event, event.user.id, bancmd, ban_type, ban_reason)
+    return False, False
 
 
 async def _banuser(event, uid: int, bancmd, ban_type, ban_reason):
     formatted_reason = f'Spambot[kv2 {ban_type} 0x{str(ban_reason).rjust(4, "0")}]'
     client: Client = event.client
-    db: Database = client.db
-    chat: Channel = await event.get_chat()
+    context: UpdateContext = event.context
+    chat: Channel = await context.chat()
     admin = chat.creator or chat.admin_rights
     await event.delete()
-    old_ban = await db.banlist.get(uid)
+    old_ban = await context.ban(uid)
     if old_ban:
         if old_ban.reason == formatted_reason:
             logger.info('User ID `%s` already banned for the same reason.', uid)
@@ -140,22 +216,19 @@ async def _banuser(event, uid: int, bancmd, ban_type, ban_reason):
         await client(DeleteUserHistoryRequest(chat, uid))
 
 
-async def _check_message(event):  # pylint: disable = R0911
+async def _check_message(event, stages: List[Stage], fingerprint: bytes):  # pylint: disable = R0911
     client: Client = event.client
     msg: Message = event.message
     user_id = msg.sender_id
     if user_id is None:
         return False, False
 
-    try:
-        result = await client(GetParticipantRequest(event.chat_id, user_id))
-        if isinstance(result.participant, ChannelParticipantAdmin):
-            return False, False
-    except (ValueError, UserNotParticipantError):
+    context: UpdateContext = event.context
+    if await context.is_admin(user_id):
         return False, False
 
     # no need to ban bots as they can only be added by users anyway
-    user = await client.get_cached_entity(user_id)
+    user = await context.user(user_id)
     if user is None or user.bot:
         return False, False
 
@@ -169,172 +242,309 @@ async def _check_message(event):  # pylint: disable = R0911
         if msg.text and msg.text.startswith(cmd):
             return False, False
 
-    db: Database = client.db
-    # tld_blacklist = db.ab_tld_blacklist.get_all()
+    # the verdict only depends on the content as long as the blacklists don't change
+    key = (client.db.blacklists.generation, tuple(stage.name for stage in stages), fingerprint)
+    verdict = _message_verdicts.get(key)
+    if verdict is None:
+        # copies arriving while the first one is checked wait for its verdict
+        task = _checking_messages.get(key)
+        if task is None:
+            task = _checking_messages[key] = asyncio.ensure_future(_run_stages(client, msg, stages, key))
+            task.add_done_callback(lambda _: _checking_messages.pop(key, None))
+        # shield the shared check so a cancelled handler doesn't cancel it for the other copies
+        verdict = await asyncio.shield(task)
+    # users that aren't in the chat like the senders of messages from a linked channel aren't banned,
+    # this is only checked for matches since it takes a request
+    if verdict[0] and not await context.is_participant(user_id):
+        return False, False
+    return verdict
+
 
-    inline_bot = msg.via_bot_id
-    if inline_bot is not None:
-        result = await db.blacklists.channel.get_by_value(inline_bot)
+async def _run_stages(client: Client, msg: Message, stages: List[Stage], key: Hashable):
+    verdict = (False, False)
+    for stage in stages:
+        result = await stage.check(client, msg)
         if result:
-            return db.blacklists.channel.hex_type, result.index
+            verdict = result
+            break
+    _message_verdicts.set(key, verdict)
+    return verdict
 
-    if msg.buttons:
-        _buttons = await msg.get_buttons()
-        button: MessageButton
-        for button in itertools.chain.from_iterable(_buttons):
-            if button.url:
-                _, chat_id, _ = await helpers.resolve_invite_link(button.url)
-                result = await db.blacklists.channel.get_by_value(chat_id)
-                if result:
-                    return db.blacklists.channel.hex_type, result.index
 
-                domain = await client.resolve_url(button.url)
-                result = await db.blacklists.domain.get_by_value(domain)
-                if result:
-                    return db.blacklists.domain.hex_type, result.index
+def _fingerprint(msg: Message) -> bytes:
+    """Digest of everything in a message that is checked against the blacklists"""
+    entities = [(type(entity).__name__, entity.offset, entity.length, getattr(entity, 'url', None))
+                for entity in msg.entities or []]
+    buttons = [button.url for button in itertools.chain.from_iterable(msg.buttons or [])]
+    content = (msg.raw_text, entities, buttons, msg.via_bot_id,
+               msg.document.id if msg.document else None, msg.photo.id if msg.photo else None)
+    return hashlib.blake2b(repr(content).encode(), digest_size=16).digest()
 
-                # tld_index = await _check_tld(domain, tld_blacklist)
-                # if tld_index:
-                #     return db.ab_tld_blacklist.hex_type, tld_index
 
-                face_domain = await helpers.netloc(button.url)
-                result = await db.blacklists.domain.get_by_value(face_domain)
-                if result:
-                    return db.blacklists.domain.hex_type, result.index
+async def _check_inline_bot(client: Client, msg: Message) -> Verdict:
+    db: Database = client.db
+    if msg.via_bot_id is not None:
+        result = await db.blacklists.channel.get_by_value(msg.via_bot_id)
+        if result:
+            return db.blacklists.channel.hex_type, result.index
+    return None
+
+
+async def _check_string(client: Client, msg: Message) -> Verdict:
+    db: Database = client.db
+    if msg.raw_text:
+        result = await db.blacklists.string.match(msg.raw_text)
+        if result:
+            return db.blacklists.string.hex_type, result.index
+    return None
 
-                elif domain in constants.TELEGRAM_DOMAINS:
-                    _entity = await client.get_cached_entity(domain)
-                    if _entity:
-                        result = await db.blacklists.channel.get_by_value(_entity)
-                        if result:
-                            return db.blacklists.channel.hex_type, result.index
 
-    entities = msg.get_entities_text()
-    for entity, text in entities:  # pylint: disable = R1702
-        _, chat_id, _ = await helpers.resolve_invite_link(text)
+async def _check_domains(client: Client, msg: Message) -> Verdict:
+    """Check the links of a message by the domain they show, without following any redirects"""
+    db: Database = client.db
+    for url in _get_urls(msg):
+        _, chat_id, _ = await helpers.resolve_invite_link(url)
         result = await db.blacklists.channel.get_by_value(chat_id)
         if result:
             return db.blacklists.channel.hex_type, result.index
+        try:
+            domain = urls.base_domain(URL(helpers.normalize_url(url)).host)
+        except ValueError:
+            domain = ''
+        for _domain in (domain, await helpers.netloc(url)):
+            if _domain:
+                result = await db.blacklists.domain.get_by_value(_domain)
+                if result:
+                    return db.blacklists.domain.hex_type, result.index
+    return None
 
-        domain = ''
-        face_domain = ''
-        channel = ''
-        _entity = None
-        if isinstance(entity, MessageEntityUrl):
-            try:
-                domain = await client.resolve_url(text)
-            except ValueError:
-                pass
-            face_domain = await helpers.netloc(text)
-            if domain in constants.TELEGRAM_DOMAINS:
-                # remove any query parameters like ?start=
-                # replace @ since some spammers started using it, only Telegram X supports it
-                url = await client.resolve_url(text, base_domain=False)
-                username = url.split('?')[0].replace('@', '')
-                _entity = username
 
-        elif isinstance(entity, MessageEntityTextUrl):
-            domain = await client.resolve_url(entity.url)
-            face_domain = await helpers.netloc(entity.url)
-            if domain in constants.TELEGRAM_DOMAINS:
-                url = await client.resolve_url(entity.url, base_domain=False)
-                username = url.split('?')[0].replace('@', '')
-                _entity = username
+async def _check_links(client: Client, msg: Message) -> Verdict:
+    """Resolve the links and mentions of a message"""
+    # resolving links and entities takes a few requests each so all of them are checked concurrently
+    checks = []
+    if msg.buttons:
+        button: MessageButton
+        for button in itertools.chain.from_iterable(msg.buttons):
+            if button.url:
+                checks.append(functools.partial(_check_button, client, button.url))
 
-        elif isinstance(entity, MessageEntityMention):
-            _entity = text
+    for entity, text in msg.get_entities_text():
+        checks.append(functools.partial(_check_entity, client, entity, text))
 
-        if _entity:
-            try:
-                try:
-                    full_entity = await client.get_cached_entity(_entity)
-                except (FloodWaitError, *GET_ENTITY_ERRORS):
-                    full_entity = None
-                if full_entity:
-                    channel = full_entity.id
-                    try:
-                        profile_photo = await client.download_profile_photo(full_entity, bytes)
-                    except constants.DOWNLOAD_ERRORS:
-                        profile_photo = None
-                    if profile_photo:
-                        try:
-                            photo_hash = await hash_photo(profile_photo)
-                            for mhash in await db.blacklists.mhash.get_all():
-                                if mhash and not mhash.retired:
-                                    if hashes_are_similar(mhash.value, photo_hash, tolerance=2):
-                                        return db.blacklists.mhash.hex_type, mhash.index
-                        except UnidentifiedImageError:
-                            pass
-
-            except (*constants.GET_ENTITY_ERRORS, ChannelPrivateError):
-                pass
-
-        # urllib doesnt like urls without a protocol
-        if not face_domain:
-            face_domain = await helpers.netloc(f'http://{domain}')
-
-        if domain:
-            result = await db.blacklists.domain.get_by_value(domain)
-            if result:
-                return db.blacklists.domain.hex_type, result.index
-            # else:
-            # tld_index = await _check_tld(domain, tld_blacklist)
-            # if tld_index:
-            #     return db.ab_tld_blacklist.hex_type, tld_index
-
-        if face_domain:
-            result = await db.blacklists.domain.get_by_value(face_domain)
-            if result:
-                return db.blacklists.domain.hex_type, result.index
-            # else:
-            # tld_index = await _check_tld(face_domain, tld_blacklist)
-            # if tld_index:
-            #     return db.ab_tld_blacklist.hex_type, tld_index
-
-        if channel:
-            result = await db.blacklists.channel.get_by_value(channel)
+    return await helpers.first_hit(checks, limit=MAX_CONCURRENT_CHECKS)
+
+
+async def _check_file_id(client: Client, msg: Message) -> Verdict:
+    """Check documents that were hashed before without downloading them"""
+    db: Database = client.db
+    if msg.document:
+        filehash = await client.get_document_hash(msg.document.id)
+        if filehash:
+            result = await db.blacklists.file.get_by_value(filehash)
             if result:
-                return db.blacklists.channel.hex_type, result.index
+                return db.blacklists.file.hex_type, result.index
+    return None
 
-    if msg.raw_text:
-        for string in await db.blacklists.string.get_all():
-            if string.value in msg.raw_text and not string.retired:
-                return db.blacklists.string.hex_type, string.index
 
-    if msg.file:
+async def _check_file(client: Client, msg: Message) -> Verdict:
+    db: Database = client.db
+    # Only download files to avoid downloading photos
+    if msg.document:
         # avoid a DoS when getting large files
-        ten_mib = (1024 ** 2) * 10
-        # Only download files to avoid downloading photos
-        if msg.document and msg.file.size < ten_mib:
-            try:
-                dl_file = await msg.download_media(bytes)
-            except constants.DOWNLOAD_ERRORS:
-                dl_file = None
-            if dl_file:
-                filehash = helpers.hash_file(dl_file)
-                result = await db.blacklists.file.get_by_value(filehash)
-                if result:
-                    return db.blacklists.file.hex_type, result.index
-        else:
-            pass
+        try:
+            filehash = await client.hash_document(msg.document, max_size=MAX_FILE_SIZE)
+        except constants.DOWNLOAD_ERRORS:
+            filehash = None
+        if filehash:
+            result = await db.blacklists.file.get_by_value(filehash)
+            if result:
+                return db.blacklists.file.hex_type, result.index
+    return None
+
 
+async def _check_photo(client: Client, msg: Message) -> Verdict:
+    db: Database = client.db
     if msg.photo:
+        source = client.config.photo_hash_source
+        # the average hash scales the photo down to 8x8 pixels so a thumbnail should give a similar hash
+        thumb = helpers.photo_thumbnail(msg.photo) if source != 'full' else None
+        if source == 'stripped':
+            stripped = helpers.stripped_thumbnail(msg.photo)
+            # the preview is too small and compressed to ban on its own, a match is confirmed with the full photo
+            if stripped and await _similar_photo(client, stripped):
+                thumb = None
         try:
-            dl_photo = await msg.download_media(bytes)
+            dl_photo = await msg.download_media(bytes, thumb=thumb)
         except constants.DOWNLOAD_ERRORS:
             dl_photo = None
         if dl_photo:
+            result = await _similar_photo(client, dl_photo)
+            if result:
+                return db.blacklists.mhash.hex_type, result.index
+    return None
+
+
+async def _similar_photo(client: Client, photo: bytes) -> Optional[BlacklistItem]:
+    """Get the blacklisted photo that is similar to a photo or None if there is none or it can't be hashed"""
+    try:
+        photo_hash = await hash_photo(photo)
+    except UnidentifiedImageError:
+        return None
+    if not photo_hash:
+        return None
+    return await client.db.blacklists.mhash.similar(photo_hash)
+
+
+def _get_urls(msg: Message) -> List[str]:
+    """Get the URLs of the buttons and entities of a message"""
+    _urls = []
+    if msg.buttons:
+        _urls.extend(button.url for button in itertools.chain.from_iterable(msg.buttons) if button.url)
+    for entity, text in msg.get_entities_text():
+        if isinstance(entity, MessageEntityUrl):
+            _urls.append(text)
+        elif isinstance(entity, MessageEntityTextUrl):
+            _urls.append(entity.url)
+    return _urls
+
+
+STAGES: Dict[str, Stage] = {stage.name: stage for stage in sorted([
+    Stage('inline_bot', Cost.CPU, _check_inline_bot),
+    Stage('string', Cost.CPU, _check_string),
+    Stage('domain', Cost.CPU, _check_domains),
+    Stage('file_id', Cost.DB, _check_file_id),
+    Stage('links', Cost.NETWORK, _check_links),
+    Stage('file', Cost.MEDIA, _check_file),
+    Stage('photo', Cost.MEDIA, _check_photo),
+], key=lambda stage: stage.cost)}
+
+
+def _get_stages(tags: Tags) -> List[Stage]:
+    """Get the stages enabled in a chat in the order they should run
+
+    The polizei_stages tag can contain a list or a comma separated string of stage names.
+    Only the listed stages are run in the listed order, without the tag all stages run ordered by cost.
+    """
+    names = tags.get('polizei_stages')
+    if not names:
+        return list(STAGES.values())
+    if isinstance(names, str):
+        names = names.split(',')
+    stages = [STAGES.get(str(name).strip()) for name in names]
+    return [stage for stage in stages if stage is not None]
+
+
+async def _check_button(client: Client, url: str) -> Verdict:
+    """Check the URL of an inline button"""
+    db: Database = client.db
+    _, chat_id, _ = await helpers.resolve_invite_link(url)
+    result = await db.blacklists.channel.get_by_value(chat_id)
+    if result:
+        return db.blacklists.channel.hex_type, result.index
+
+    link = await client.resolve(url)
+    result = await db.blacklists.domain.get_by_value(link.domain)
+    if result:
+        return db.blacklists.domain.hex_type, result.index
+
+    # tld_index = await _check_tld(domain, tld_blacklist)
+    # if tld_index:
+    #     return db.ab_tld_blacklist.hex_type, tld_index
+
+    face_domain = await helpers.netloc(url)
+    result = await db.blacklists.domain.get_by_value(face_domain)
+    if result:
+        return db.blacklists.domain.hex_type, result.index
+
+    elif link.telegram and link.telegram.username:
+        try:
+            _entity = await client.get_cached_entity(link.telegram.username)
+        except (FloodWaitError, *GET_ENTITY_ERRORS):
+            _entity = None
+        if _entity:
+            result = await db.blacklists.channel.get_by_value(_entity.id)
+            if result:
+                return db.blacklists.channel.hex_type, result.index
+
+    return None
+
+
+async def _check_entity(client: Client, entity, text: str) -> Verdict:  # pylint: disable = R0911, R0912
+    """Check a mention or URL entity of a message"""
+    db: Database = client.db
+    _, chat_id, _ = await helpers.resolve_invite_link(text)
+    result = await db.blacklists.channel.get_by_value(chat_id)
+    if result:
+        return db.blacklists.channel.hex_type, result.index
+
+    domain = ''
+    face_domain = ''
+    channel = ''
+    _entity = None
+    if isinstance(entity, MessageEntityUrl):
+        link = await client.resolve(text)
+        domain = link.domain
+        face_domain = await helpers.netloc(text)
+        if link.telegram:
+            _entity = link.telegram.username
+
+    elif isinstance(entity, MessageEntityTextUrl):
+        link = await client.resolve(entity.url)
+        domain = link.domain
+        face_domain = await helpers.netloc(entity.url)
+        if link.telegram:
+            _entity = link.telegram.username
+
+    elif isinstance(entity, MessageEntityMention):
+        _entity = text
+
+    if _entity:
+        try:
             try:
-                photo_hash = await hash_photo(dl_photo)
-            except UnidentifiedImageError:
-                photo_hash = None
-            if photo_hash:
-                for mhash in await db.blacklists.mhash.get_all():
-                    if not mhash.retired:
-                        if hashes_are_similar(mhash.value, photo_hash, tolerance=2):
-                            return db.blacklists.mhash.hex_type, mhash.index
+                full_entity = await client.get_cached_entity(_entity)
+            except (FloodWaitError, *GET_ENTITY_ERRORS):
+                full_entity = None
+            if full_entity:
+                channel = full_entity.id
+                photo_hash = await client.hash_profile_photo(full_entity)
+                if photo_hash:
+                    result = await db.blacklists.mhash.similar(photo_hash)
+                    if result:
+                        return db.blacklists.mhash.hex_type, result.index
+
+        except (*constants.GET_ENTITY_ERRORS, ChannelPrivateError):
+            pass
+
+    # urllib doesnt like urls without a protocol
+    if not face_domain:
+        face_domain = await helpers.netloc(f'http://{domain}')
+
+    if domain:
+        result = await db.blacklists.domain.get_by_value(domain)
+        if result:
+            return db.blacklists.domain.hex_type, result.index
+        # else:
+        # tld_index = await _check_tld(domain, tld_blacklist)
+        # if tld_index:
+        #     return db.ab_tld_blacklist.hex_type, tld_index
+
+    if face_domain:
+        result = await db.blacklists.domain.get_by_value(face_domain)
+        if result:
+            return db.blacklists.domain.hex_type, result.index
+        # else:
+        # tld_index = await _check_tld(face_domain, tld_blacklist)
+        # if tld_index:
+        #     return db.ab_tld_blacklist.hex_type, tld_index
+
+    if channel:
+        result = await db.blacklists.channel.get_by_value(channel)
+        if result:
+            return db.blacklists.channel.hex_type, result.index
+
+    return None
 
-    return False, False
 
 # async def _check_tld(domain, tld_blacklist):
 #     domain, tld = domain.split('.')
@@ -5,16 +5,21 @@ from telethon.events import NewMessage
 from telethon.tl.types import Channel
 
 from kantek import Client
-from kantek.utils.pluginmgr import k
+from kantek.utils.context import UpdateContext
+from kantek.utils.pluginmgr import k, Priority
 
 tlog = logging.getLogger('kantek-channel-log')
 
 
-@k.event(events.NewMessage())
+@k.event(events.NewMessage(), priority=Priority.LOW)
 async def add_groups(event: NewMessage.Event) -> None:
     if event.is_private:
         return
     client: Client = event.client
+    context: UpdateContext = event.context
     await client.db.cleanup()
-    c: Channel = event.chat
-    await client.db.chats.add(event.chat_id, c.title)
+    c: Channel = await context.chat()
+    tags = await context.tags()
+    # the tags are loaded from the chats row anyway so it is only written when the title changed
+    if tags.title != c.title:
+        await client.db.chats.add(event.chat_id, c.title)
@@ -1,13 +1,20 @@
+import asyncio
+import random
+import time as _time
 from datetime import timedelta
 from pprint import pformat
 from typing import List, Dict
 
 from kantex.md import *
+from photohash import hash_distance, hashes_are_similar
 from telethon.tl.custom import Message
+from telethon.tl.types import InputMessagesFilterPhotos
 from telethon.tl.functions.messages import MigrateChatRequest
 
 from kantek import Database
-from kantek.utils import parsers
+from kantek.database import BlacklistItem
+from kantek.database.matchers import HammingIndex, PackedHammingIndex, np
+from kantek.utils import parsers, helpers, hashing
 from kantek import Client
 from kantek.utils.parsers import MissingExpression
 from kantek.utils.pluginmgr import k, _Command, _Signature
@@ -157,3 +164,205 @@ async def upgrade(client, chat):
     """Upgrade a normal chat to a supergroup
     """
     await client(MigrateChatRequest(chat.id))
+
+
+@dev.subcommand()
+async def mhashbench(kwargs) -> KanTeXDocument:
+    """Benchmark the photo hash lookups with random hashes
+
+    Compares the loop over all blacklist items with the multi-index and the numpy index.
+
+    Arguments:
+        `sizes`: Amount of hashes in the blacklist, defaults to 1k, 10k and 100k
+        `queries`: Amount of lookups per size
+
+    Examples:
+        {cmd}
+        {cmd} sizes: [1000, 5000] queries: 100
+    """
+    sizes = kwargs.get('sizes', [1_000, 10_000, 100_000])
+    if isinstance(sizes, int):
+        sizes = [sizes]
+    queries = kwargs.get('queries', 10)
+    loop = asyncio.get_event_loop()
+    sec = Section('MHash Lookup Benchmark')
+    for size in sizes:
+        timings = await loop.run_in_executor(None, _bench_mhash, size, queries)
+        sec.append(SubSection(f'{size} hashes',
+                              *[KeyValueItem(name, f'{timing * 1e6:.1f}µs') for name, timing in timings.items()]))
+    return KanTeXDocument(sec, Italic(f'Average of {queries} lookups'))
+
+
+def _bench_mhash(size: int, queries: int) -> Dict[str, float]:
+    items = [BlacklistItem(i, f'{random.getrandbits(64):016x}', False) for i in range(1, size + 1)]
+    # most photos don't match anything which is the worst case for the loop
+    lookups = [f'{random.getrandbits(64):016x}' for _ in range(queries)]
+
+    def _loop(photo_hash):
+        for item in items:
+            if not item.retired and hashes_are_similar(item.value, photo_hash, tolerance=2):
+                return item.index
+        return None
+
+    searches = {'loop': _loop}
+    index_types = {'multi-index': HammingIndex}
+    if np is not None:
+        index_types['numpy'] = PackedHammingIndex
+    for name, index_type in index_types.items():
+        index = index_type(2)
+        for item in items:
+            index.add(item.value, item.index)
+        searches[name] = index.search
+
+    timings = {}
+    for name, search in searches.items():
+        start = _time.perf_counter()
+        for photo_hash in lookups:
+            search(photo_hash)
+        timings[name] = (_time.perf_counter() - start) / queries
+    return timings
+
+
+@dev.subcommand()
+async def photobench(client: Client, db: Database, msg: Message, kwargs) -> KanTeXDocument:
+    """Compare hashing photos in full resolution with hashing their thumbnails
+
+    Hashes the last photos of the chat from every source and reports the download time, how far the hashes
+    are from the hash of the full photo and if they match the same mhash blacklist items.
+
+    Arguments:
+        `limit`: Amount of photos to check, defaults to 50
+
+    Examples:
+        {cmd}
+        {cmd} limit: 200
+    """
+    limit = kwargs.get('limit', 50)
+    mhash = db.blacklists.mhash
+    sources = ['full', 'thumbnail', 'stripped']
+    timings = {source: 0.0 for source in sources}
+    distances = {source: [] for source in sources}
+    mismatches = {source: 0 for source in sources}
+    hits = {source: 0 for source in sources}
+    photos = 0
+    async for photo_msg in client.iter_messages(msg.chat_id, limit=limit, filter=InputMessagesFilterPhotos):
+        photo = photo_msg.photo
+        if photo is None:
+            continue
+        photos += 1
+        hashes = {}
+        for source in sources:
+            start = _time.perf_counter()
+            if source == 'stripped':
+                data = helpers.stripped_thumbnail(photo)
+            else:
+                thumb = helpers.photo_thumbnail(photo) if source == 'thumbnail' else None
+                data = await photo_msg.download_media(bytes, thumb=thumb)
+            timings[source] += _time.perf_counter() - start
+            if data:
+                hashes[source] = await helpers.hash_photo(data)
+        if 'full' not in hashes:
+            continue
+        full_match = await mhash.similar(hashes['full'])
+        for source, photo_hash in hashes.items():
+            distances[source].append(hash_distance(hashes['full'], photo_hash))
+            match = await mhash.similar(photo_hash)
+            hits[source] += match is not None
+            if (match and match.index) != (full_match and full_match.index):
+                mismatches[source] += 1
+
+    if not photos:
+        return KanTeXDocument(Italic('No photos found'))
+    sec = Section('Photo Hash Benchmark')
+    for source in sources:
+        checked = distances[source]
+        similar = sum(distance <= mhash.tolerance for distance in checked)
+        sec.append(SubSection(
+            source,
+            KeyValueItem('Hashed', f'{len(checked)}/{photos}'),
+            KeyValueItem('Time', f'{timings[source] / photos * 1000:.1f}ms'),
+            KeyValueItem('Avg distance', f'{sum(checked) / len(checked):.2f}' if checked else '-'),
+            KeyValueItem('Max distance', max(checked, default='-')),
+            KeyValueItem('Similar to full', f'{similar}/{len(checked)}'),
+            KeyValueItem('Blacklist hits', hits[source]),
+            KeyValueItem('Differing hits', mismatches[source])))
+    return KanTeXDocument(sec, Italic(f'Distances are in differing hex digits, the tolerance is {mhash.tolerance}'))
+
+
+@dev.subcommand()
+async def hashstats() -> KanTeXDocument:
+    """Show the latency of the photo hashing processes
+
+    Examples:
+        {cmd}
+    """
+    hasher = hashing.get_hasher()
+    stats = hasher.stats()
+    sec = Section('Photo Hashing',
+                  KeyValueItem('Workers', hasher.workers or 'thread'),
+                  KeyValueItem('Queue size', hasher.max_pending),
+                  KeyValueItem('Jobs', stats['jobs']),
+                  KeyValueItem('Failed', stats['failed']),
+                  KeyValueItem('Waiting', stats['waiting']))
+    for name in ['p50', 'p95', 'max']:
+        if name in stats:
+            sec.append(KeyValueItem(name, f'{stats[name] * 1000:.1f}ms'))
+    return KanTeXDocument(sec, Italic(f'Latencies of the last {hashing.LATENCY_WINDOW} jobs '
+                                      f'including the time waiting'))
+
+
+@dev.subcommand()
+async def queue(client: Client) -> KanTeXDocument:
+    """Show how many events are waiting to be handled
+
+    Examples:
+        {cmd}
+    """
+    scheduler = client.plugin_mgr.scheduler
+    sec = Section('Event Queue',
+                  KeyValueItem('Workers', scheduler.workers),
+                  KeyValueItem('Reserved workers', scheduler.reserved),
+                  KeyValueItem('Limit', scheduler.max_queued),
+                  *[KeyValueItem(name.replace('_', ' ').capitalize(), value)
+                    for name, value in scheduler.stats().items()])
+    lanes = [KeyValueItem(f'{Code(chat)} {Italic(priority.name.lower())}', depth)
+             for (priority, chat), depth in scheduler.deepest_lanes()]
+    return KanTeXDocument(sec, Section('Deepest Lanes', *lanes) if lanes else None)
+
+
+@dev.subcommand()
+async def banindex(db: Database) -> KanTeXDocument:
+    """Show the memory use and false positive rate of the in-memory banlist
+
+    Examples:
+        {cmd}
+    """
+    stats = db.banlist.index_stats()
+    sec = Section('Banlist Index', KeyValueItem('Type', stats.pop('index')))
+    if 'memory' in stats:
+        sec.append(KeyValueItem('Memory', f'{stats.pop("memory") / 1024 ** 2:.2f}MiB'))
+    if 'false_positive_rate' in stats:
+        sec.append(KeyValueItem('False positive rate', f'{stats.pop("false_positive_rate"):.4%}'))
+    for name, value in stats.items():
+        sec.append(KeyValueItem(name.replace('_', ' ').capitalize(), value))
+    return KanTeXDocument(sec)
+
+
+@dev.subcommand()
+async def sweep(client: Client) -> KanTeXDocument:
+    """Show the progress of the banlist sweep
+
+    Examples:
+        {cmd}
+    """
+    sweeper = client.sweeper
+    if sweeper is None:
+        return KanTeXDocument(Section('Banlist Sweep',
+                                      Italic('Disabled, set sweep_interval in the config to enable it')))
+    current = sweeper.current
+    sec = Section('Banlist Sweep',
+                  KeyValueItem('Interval', sweeper.interval),
+                  KeyValueItem('Current chat', f'{current.title} [{Code(current.id)}]' if current else Italic('None')),
+                  *[KeyValueItem(name.replace('_', ' ').capitalize(), value)
+                    for name, value in sweeper.stats().items()])
+    return KanTeXDocument(sec)
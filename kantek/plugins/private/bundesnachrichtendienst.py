@@ -7,10 +7,10 @@ from telethon.events import NewMessage
 
 from kantek import Client, Database
 from kantek import Command
-from kantek.utils.pluginmgr import k
+from kantek.utils.pluginmgr import k, Priority
 
 
-@k.event(events.NewMessage(incoming=True))
+@k.event(events.NewMessage(incoming=True), priority=Priority.LOW)
 async def bundesnachrichtendienst_event(event: NewMessage.Event) -> None:
     if event.is_private:
         return
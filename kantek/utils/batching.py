@@ -0,0 +1,87 @@
+"""Collect events that arrive within a short time so they can be handled together."""
+import asyncio
+import functools
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+import logzero
+
+from .scheduler import Priority, Scheduler
+
+logger: logging.Logger = logzero.logger
+
+Handler = Callable[[Hashable, List[Any]], Awaitable[None]]
+
+
+class Batcher:
+    """Collect items per key and pass them to the handler together
+
+    The handler is called once `window` seconds passed since the first item of a key arrived
+    or once `max_size` items were collected, whichever happens first. If a scheduler is passed along with
+    the items the batch is queued in the lane of its key, otherwise the handler is started right away.
+    The items of batches the scheduler dropped because its queue was full are counted in `dropped`.
+
+    >>> async def main():
+    ...     batches = []
+    ...     async def handler(key, items):
+    ...         batches.append((key, items))
+    ...     batcher = Batcher(handler, window=0.01)
+    ...     for item in range(3):
+    ...         batcher.add('chat', item)
+    ...     await asyncio.sleep(0.05)
+    ...     return batches
+    >>> asyncio.run(main())
+    [('chat', [0, 1, 2])]
+
+    Args:
+        handler: Called with the key and the collected items
+        window: Seconds to wait for more items after the first one
+        max_size: Maximum amount of items passed to the handler at once
+        priority: The priority of the batches in the scheduler
+    """
+
+    def __init__(self, handler: Handler, window: float = 0.25, max_size: int = 500,
+                 priority: Priority = Priority.NORMAL) -> None:
+        self.handler = handler
+        self.window = window
+        self.max_size = max_size
+        self.priority = priority
+        self.dropped = 0
+        self._pending: Dict[Hashable, List[Any]] = {}
+        self._timers: Dict[Hashable, asyncio.TimerHandle] = {}
+        self._schedulers: Dict[Hashable, Optional[Scheduler]] = {}
+
+    def add(self, key: Hashable, item: Any, scheduler: Optional[Scheduler] = None) -> None:
+        """Add an item to the current batch of the key
+
+        Args:
+            key: The key of the batch, used as the lane in the scheduler
+            item: The item
+            scheduler: The scheduler the batch is queued in once it is complete
+        """
+        items = self._pending.get(key)
+        if items is None:
+            items = self._pending[key] = []
+            self._timers[key] = asyncio.get_event_loop().call_later(self.window, self._flush, key)
+        self._schedulers[key] = scheduler
+        items.append(item)
+        if len(items) >= self.max_size:
+            self._timers[key].cancel()
+            self._flush(key)
+
+    def _flush(self, key: Hashable) -> None:
+        del self._timers[key]
+        items = self._pending.pop(key)
+        scheduler = self._schedulers.pop(key)
+        if scheduler is None:
+            asyncio.ensure_future(self._handle(key, items))
+        else:
+            if not scheduler.submit(key, functools.partial(self._handle, key, items), priority=self.priority):
+                self.dropped += len(items)
+                logger.warning('Dropped a batch of %s items for %s because the queue is full', len(items), key)
+
+    async def _handle(self, key: Hashable, items: List[Any]) -> None:
+        try:
+            await self.handler(key, items)
+        except Exception as err:  # pylint: disable = W0703
+            logger.exception(err)
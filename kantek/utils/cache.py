@@ -0,0 +1,72 @@
+"""Small in-memory caches used to avoid repeating expensive lookups."""
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """Least recently used cache with entries that expire after a time to live
+
+    >>> cache = TTLCache(maxsize=2, ttl=60)
+    >>> cache.set('a', 1)
+    >>> cache.set('b', 2)
+    >>> cache.get('a')
+    1
+    >>> cache.set('c', 3)
+    >>> 'b' in cache
+    False
+    >>> cache.set('d', 4, ttl=0)
+    >>> cache.get('d', 'expired')
+    'expired'
+
+    Args:
+        maxsize: The maximum amount of entries, the least recently used entry is evicted first
+        ttl: Default time to live of entries in seconds
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: 'OrderedDict[Hashable, Tuple[float, Any]]' = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self._lookup(key) is not None
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get the value for the key or the default if it is missing or expired"""
+        entry = self._lookup(key)
+        if entry is None:
+            return default
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Store a value, the default time to live is used if none is specified"""
+        if ttl is None:
+            ttl = self.ttl
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove the key and return its value"""
+        entry = self._data.pop(key, None)
+        if entry is None or entry[0] <= time.monotonic():
+            return default
+        return entry[1]
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def _lookup(self, key: Hashable) -> Optional[Tuple[float, Any]]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return entry
@@ -4,25 +4,34 @@ import datetime
 import logging
 import re
 import socket
-from typing import Optional, Union, Tuple
+from typing import Any, Callable, Dict, NamedTuple, Optional, Sequence, Union, Tuple
 
 import logzero
 import spamwatch
 from aiohttp import ClientTimeout, ClientSession, ClientError
+from PIL import UnidentifiedImageError
 from faker import Faker
 from kantex.md import KanTeXDocument
 from spamwatch.types import Permission
-from telethon import TelegramClient, hints
-from telethon.errors import UserAdminInvalidError
+from telethon import TelegramClient, events, hints
+from telethon.errors import RPCError, UserAdminInvalidError, UserNotParticipantError
 from telethon.events import NewMessage, ChatAction
-from telethon.tl.functions.channels import EditBannedRequest
+from telethon.tl.functions.channels import EditBannedRequest, GetParticipantRequest
+from telethon.tl.functions.users import GetFullUserRequest
 from telethon.tl.patched import Message
-from telethon.tl.types import ChatBannedRights, User
+from telethon.tl.types import (ChatBannedRights, Document, User, UserFull, TypePhoto, ChannelParticipantsAdmins,
+                               ChannelParticipantAdmin, ChannelParticipantCreator, ChatParticipantAdmin,
+                               ChatParticipantCreator, InputPeerChannel, PeerChannel,
+                               TypeChannelParticipant, UpdateChannelParticipant, Photo)
 from yarl import URL
 
 from ..database import Database
-from ..utils import parsers, helpers
+from ..utils import parsers, helpers, urls, constants, hashing
+from .cache import TTLCache
 from .pluginmgr import PluginManager
+from .ratelimit import RateLimiter
+from .sweeper import Sweeper
+from .urls import ResolvedURL
 from .. import Config
 
 logger: logging.Logger = logzero.logger
@@ -30,10 +39,43 @@ logger: logging.Logger = logzero.logger
 AUTOMATED_BAN_REASONS = ['spambot', 'vollzugsanstalt', 'kriminalamt']
 SPAMADD_PATTERN = re.compile(r"spam adding (?P<count>\d+)\+ members")
 
+FULL_USER_CACHE_SIZE = 10_000
+FULL_USER_CACHE_TTL = 10 * 60
+# full users are requested for every user joining a chat, during raids they are fetched at this rate
+FULL_USER_RATE = 5
+FULL_USER_BURST = 20
+
+URL_CACHE_SIZE = 50_000
+URL_CACHE_TTL = 6 * 60 * 60
+# unreachable URLs are retried sooner in case the failure was temporary
+URL_CACHE_NEGATIVE_TTL = 10 * 60
+
+ADMIN_CACHE_SIZE = 5_000
+# admin changes in chats we don't administrate aren't sent to us so the lists expire after a while
+ADMIN_CACHE_TTL = 15 * 60
+
+PHOTO_HASH_CACHE_SIZE = 100_000
+# photos never change so entries are only evicted to bound the memory usage
+PHOTO_HASH_CACHE_TTL = 7 * 24 * 60 * 60
+
+DOCUMENT_HASH_CACHE_SIZE = 100_000
+DOCUMENT_HASH_CACHE_TTL = 7 * 24 * 60 * 60
+# documents that weren't hashed yet are looked up again after this many seconds
+DOCUMENT_HASH_NEGATIVE_TTL = 60
+
+_MISSING = object()
+
+
+class FullUser(NamedTuple):
+    """The parts of a UserFull that are checked against the blacklists"""
+    about: Optional[str]
+    profile_photo: Optional[TypePhoto]
+
 
 class Client(TelegramClient):  # pylint: disable = R0901, W0223
     """Custom telethon client that has the plugin manager as attribute."""
     plugin_mgr: Optional[PluginManager] = None
+    sweeper: Optional[Sweeper] = None
     db: Database = None
     kantek_version: str = ''
     sw: spamwatch.Client = None
@@ -45,6 +87,16 @@ class Client(TelegramClient):  # pylint: disable = R0901, W0223
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.aioclient = ClientSession(timeout=ClientTimeout(total=2))
+        self._full_users = TTLCache(FULL_USER_CACHE_SIZE, FULL_USER_CACHE_TTL)
+        self._full_user_limiter = RateLimiter(FULL_USER_RATE, FULL_USER_BURST)
+        self._resolved_urls = TTLCache(URL_CACHE_SIZE, URL_CACHE_TTL)
+        self._resolving: Dict[str, asyncio.Future] = {}
+        self._faker = Faker()
+        self._photo_hashes = TTLCache(PHOTO_HASH_CACHE_SIZE, PHOTO_HASH_CACHE_TTL)
+        self._document_hashes = TTLCache(DOCUMENT_HASH_CACHE_SIZE, DOCUMENT_HASH_CACHE_TTL)
+        self._admins = TTLCache(ADMIN_CACHE_SIZE, ADMIN_CACHE_TTL)
+        self._fetching_admins: Dict[int, asyncio.Future] = {}
+        self.add_event_handler(self._participant_updated, events.Raw(UpdateChannelParticipant))
 
     async def respond(self, event: NewMessage.Event,
                       msg: Union[str, KanTeXDocument],
@@ -166,18 +218,24 @@ class Client(TelegramClient):  # pylint: disable = R0901, W0223
                                               Permission.Root]:
             self.sw.delete_ban(int(uid))
 
-    async def ban(self, chat, uid):
-        """Bans a user from a chat."""
-        if not self.config.debug_mode:
-            try:
-                await self(EditBannedRequest(
-                    chat, uid, ChatBannedRights(
-                        until_date=datetime.datetime(2038, 1, 1),
-                        view_messages=True
-                    )
-                ))
-            except UserAdminInvalidError as err:
-                logger.error(err)
+    async def ban(self, chat, uid) -> bool:
+        """Bans a user from a chat.
+
+        Returns: True if the user was banned, False in debug mode or if the user is an admin we can't ban
+        """
+        if self.config.debug_mode:
+            return False
+        try:
+            await self(EditBannedRequest(
+                chat, uid, ChatBannedRights(
+                    until_date=datetime.datetime(2038, 1, 1),
+                    view_messages=True
+                )
+            ))
+        except UserAdminInvalidError as err:
+            logger.error(err)
+            return False
+        return True
 
     async def get_cached_entity(self, entity: hints.EntitiesLike):
         """Get the cached version of a entity"""
@@ -187,6 +245,201 @@ class Client(TelegramClient):  # pylint: disable = R0901, W0223
         except ValueError:
             return None
 
+    async def get_admins(self, chat: hints.EntityLike) -> Dict[int, TypeChannelParticipant]:
+        """Get the admins and the creator of a chat
+
+        The list is cached per chat and dropped when an admin is promoted or demoted.
+
+        Args:
+            chat: The chat
+
+        Returns: The participants of the admins by their user id
+        """
+        chat_id = await self.get_peer_id(chat)
+        admins = self._admins.get(chat_id)
+        if admins is not None:
+            return admins
+        task = self._fetching_admins.get(chat_id)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_admins(chat_id))
+            self._fetching_admins[chat_id] = task
+            task.add_done_callback(lambda _: self._fetching_admins.pop(chat_id, None))
+        return await asyncio.shield(task)
+
+    async def _fetch_admins(self, chat_id: int) -> Dict[int, TypeChannelParticipant]:
+        admin_types = (ChannelParticipantAdmin, ChannelParticipantCreator, ChatParticipantAdmin, ChatParticipantCreator)
+        admins = {}
+        async for user in self.iter_participants(chat_id, filter=ChannelParticipantsAdmins()):
+            # basic groups ignore the filter and return every member
+            if isinstance(user.participant, admin_types):
+                admins[user.id] = user.participant
+        self._admins.set(chat_id, admins)
+        return admins
+
+    async def get_admin(self, chat: hints.EntityLike, uid: int) -> Optional[TypeChannelParticipant]:
+        """Get the participant of a user if they are an admin or the creator of the chat"""
+        return (await self.get_admins(chat)).get(uid)
+
+    async def is_admin(self, chat: hints.EntityLike, uid: int) -> bool:
+        """Check if a user is an admin or the creator of the chat"""
+        return uid in await self.get_admins(chat)
+
+    async def is_participant(self, chat: hints.EntityLike, uid: int) -> bool:
+        """Check if a user is a participant of the chat
+
+        Basic groups can't be asked for a single participant so everyone is assumed to be one.
+        """
+        try:
+            input_chat = await self.get_input_entity(chat)
+            if not isinstance(input_chat, InputPeerChannel):
+                return True
+            await self(GetParticipantRequest(input_chat, uid))
+        except (ValueError, UserNotParticipantError):
+            return False
+        return True
+
+    def invalidate_admins(self, chat_id: int) -> None:
+        """Drop the cached admins of a chat so they are fetched again on the next use"""
+        self._admins.pop(chat_id)
+
+    async def _participant_updated(self, update: UpdateChannelParticipant) -> None:
+        admin_types = (ChannelParticipantAdmin, ChannelParticipantCreator)
+        if isinstance(update.prev_participant, admin_types) or isinstance(update.new_participant, admin_types):
+            self.invalidate_admins(await self.get_peer_id(PeerChannel(update.channel_id)))
+
+    async def hash_profile_photo(self, entity: Union[hints.EntityLike, Photo]) -> Optional[str]:
+        """Get the average hash of the profile photo of an entity
+
+        Hashes are cached by the photo id and dc so photos reused by many accounts are only downloaded once.
+
+        Args:
+            entity: The user or chat, or the photo of a UserFull
+
+        Returns: The hash or None if the entity has no photo or it can't be downloaded
+        """
+        if isinstance(entity, Photo):
+            key = (entity.id, entity.dc_id)
+        else:
+            photo = getattr(entity, 'photo', None)
+            key = (getattr(photo, 'photo_id', None), getattr(photo, 'dc_id', None))
+        if None in key:
+            return None
+        photo_hash = self._photo_hashes.get(key)
+        if photo_hash is not None:
+            return photo_hash
+        if self.config.persist_photo_hashes:
+            photo_hash = await self.db.photo_hashes.get(*key)
+        if photo_hash is None:
+            try:
+                if isinstance(entity, Photo):
+                    dl_photo = await self.download_file(entity)
+                else:
+                    dl_photo = await self.download_profile_photo(entity, bytes)
+            except constants.DOWNLOAD_ERRORS:
+                return None
+            if not dl_photo:
+                return None
+            try:
+                photo_hash = await helpers.hash_photo(dl_photo)
+            except UnidentifiedImageError:
+                return None
+            if self.config.persist_photo_hashes:
+                await self.db.photo_hashes.add(*key, photo_hash)
+        self._photo_hashes.set(key, photo_hash)
+        return photo_hash
+
+    async def get_document_hash(self, document_id: int) -> Optional[str]:
+        """Get the SHA512 hash of a document that was hashed before without downloading it
+
+        Args:
+            document_id: The id of the Telegram document
+
+        Returns: The hash or None if the document wasn't hashed yet
+        """
+        file_hash = self._document_hashes.get(document_id, _MISSING)
+        if file_hash is _MISSING:
+            file_hash = await self.db.document_hashes.get(document_id)
+            # misses are cached briefly so the file_id and file stage don't both query the database
+            ttl = DOCUMENT_HASH_NEGATIVE_TTL if file_hash is None else None
+            self._document_hashes.set(document_id, file_hash, ttl)
+        return file_hash
+
+    async def add_document_hash(self, document_id: int, file_hash: str) -> None:
+        """Remember the SHA512 hash of a document so it doesn't need to be downloaded again"""
+        self._document_hashes.set(document_id, file_hash)
+        await self.db.document_hashes.add(document_id, file_hash)
+
+    async def hash_document(self, document: Document, max_size: Optional[int] = None,
+                            progress_callback: Optional[Callable[[int, int], Any]] = None) -> Optional[str]:
+        """Get the SHA512 hash of a document
+
+        The document is only downloaded if it wasn't hashed before and is hashed while it is downloaded
+        so it is never held in memory completely.
+
+        Args:
+            document: The document
+            max_size: Don't download documents larger than this many bytes
+            progress_callback: Called with the received and total bytes during the download
+
+        Returns: The hash or None if the document is too large
+        """
+        file_hash = await self.get_document_hash(document.id)
+        if file_hash is not None:
+            return file_hash
+        if max_size is not None and document.size > max_size:
+            return None
+        callback = None
+        if progress_callback is not None:
+            def _report_progress(received):
+                progress_callback(received, document.size)
+            callback = _report_progress
+        # the download has to be closed explicitly in case it is aborted early
+        async with self.iter_download(document, file_size=document.size) as chunks:
+            file_hash = await helpers.hash_chunks(chunks, max_size, callback)
+        if file_hash is not None:
+            await self.add_document_hash(document.id, file_hash)
+        return file_hash
+
+    async def get_full_user(self, user: hints.EntityLike) -> FullUser:
+        """Get the bio and profile photo of a user
+
+        Results are cached by user id so users joining multiple chats are only fetched once.
+
+        Args:
+            user: The user or input user
+
+        Returns: The users bio and profile photo
+        """
+        uid = await self.get_peer_id(user)
+        full_user: Optional[FullUser] = self._full_users.get(uid)
+        if full_user is None:
+            result: UserFull = await self._full_user_limiter.run(lambda: self(GetFullUserRequest(user)))
+            full_user = FullUser(result.about, result.profile_photo)
+            self._full_users.set(uid, full_user)
+        return full_user
+
+    async def get_full_users(self, users: Sequence[hints.EntityLike]) -> Dict[int, FullUser]:
+        """Get the bio and profile photo of multiple users
+
+        There is no request for multiple full users so they are fetched concurrently at a limited rate.
+
+        Args:
+            users: The users or input users
+
+        Returns: The users bio and profile photo by user id, users that couldn't be fetched are left out
+        """
+        uids = [await self.get_peer_id(user) for user in users]
+        results = await asyncio.gather(*[self.get_full_user(user) for user in users], return_exceptions=True)
+        full_users = {}
+        for uid, result in zip(uids, results):
+            if isinstance(result, (RPCError, TypeError, ValueError)):
+                logger.error('Could not get the full user of %s: %s', uid, result)
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                full_users[uid] = result
+        return full_users
+
     async def resolve_url(self, url: str, base_domain: bool = True) -> str:
         """Follow all redirects and return the base domain
 
@@ -197,30 +450,93 @@ class Client(TelegramClient):  # pylint: disable = R0901, W0223
         Returns:
             The base comain as given by urllib.parse
         """
-        faker = Faker()
-        headers = {'User-Agent': faker.user_agent()}
         old_url = url
-        if not url.startswith('http'):
-            url: str = f'http://{url}'
         try:
-            async with self.aioclient.get(url, headers=headers) as response:
-                url: URL = response.url
-        except (ClientError, asyncio.TimeoutError, socket.gaierror) as err:
+            resolved = await self._follow_redirects(helpers.normalize_url(url))
+        except ValueError:
+            resolved = None
+        if resolved is None:
             if base_domain:
                 return await helpers.netloc(old_url)
             else:
-                raise
+                raise ClientError(f'Could not resolve {old_url}')
+        url: URL = URL(resolved)
 
         if base_domain:
             # split up the result to only get the base domain
             # www.sitischu.com => sitischu.com
-            url: Optional[str] = url.host
-            _base_domain = url.split('.', maxsplit=url.count('.') - 1)[-1]
-            if _base_domain:
-                url: str = _base_domain
+            url: str = urls.base_domain(url.host)
 
         return str(url)
 
+    async def resolve(self, url: str) -> ResolvedURL:
+        """Resolve a URL as cheap as possible
+
+        Telegram links are parsed locally and only links on known URL shorteners are followed over HTTP.
+        Every other URL is reduced to its base domain without any network request.
+
+        Args:
+            url: The url, with or without scheme
+
+        Returns:
+            The final url, its base domain and the parsed Telegram link if it points to Telegram
+        """
+        telegram = urls.parse_telegram_link(url)
+        try:
+            normalized = helpers.normalize_url(url)
+            host = URL(normalized).host
+        except ValueError:
+            return ResolvedURL(url, '', telegram)
+        if telegram is None and urls.is_shortener(host):
+            resolved = await self._follow_redirects(normalized)
+            if resolved is not None:
+                normalized = resolved
+                host = URL(resolved).host
+                telegram = urls.parse_telegram_link(resolved)
+        return ResolvedURL(normalized, urls.base_domain(host), telegram)
+
+    async def _follow_redirects(self, url: str) -> Optional[str]:
+        """Get the URL a normalized URL redirects to or None if it can't be reached
+
+        Results are cached and concurrent requests for the same URL share a single request.
+        """
+        resolved = self._resolved_urls.get(url, _MISSING)
+        if resolved is not _MISSING:
+            return resolved
+        task = self._resolving.get(url)
+        if task is None:
+            task = asyncio.ensure_future(self._resolve(url))
+            self._resolving[url] = task
+            task.add_done_callback(lambda _: self._resolving.pop(url, None))
+        # shield the shared request so a cancelled caller doesn't cancel it for everyone else
+        return await asyncio.shield(task)
+
+    async def _resolve(self, url: str) -> Optional[str]:
+        if self.config.persist_url_cache:
+            cached = await self.db.resolved_urls.get(url)
+            if cached is not None:
+                self._resolved_urls.set(url, cached.resolved, cached.ttl)
+                return cached.resolved
+
+        headers = {'User-Agent': self._faker.user_agent()}
+        try:
+            # only the location is needed so try without downloading the body first
+            async with self.aioclient.head(url, headers=headers, allow_redirects=True) as response:
+                resolved: Optional[str] = str(response.url)
+                head_allowed = response.status not in (405, 501)
+            if not head_allowed:
+                async with self.aioclient.get(url, headers=headers) as response:
+                    resolved = str(response.url)
+            ttl = URL_CACHE_TTL
+        except (ClientError, asyncio.TimeoutError, socket.gaierror):
+            resolved = None
+            ttl = URL_CACHE_NEGATIVE_TTL
+
+        self._resolved_urls.set(url, resolved, ttl)
+        if self.config.persist_url_cache:
+            await self.db.resolved_urls.add(url, resolved, ttl)
+        return resolved
+
     async def get_me(self, input_peer: bool = False) -> User:
         if self._me is None:
             self._me = await super().get_me()
@@ -231,4 +547,9 @@ class Client(TelegramClient):  # pylint: disable = R0901, W0223
         loop = asyncio.get_event_loop()
         loop.create_task(self.aioclient.close())
         loop.create_task(self.db.disconnect())
+        hashing.get_hasher().shutdown()
+        if self.plugin_mgr is not None:
+            self.plugin_mgr.scheduler.stop()
+        if self.sweeper is not None:
+            self.sweeper.stop()
         return super().disconnect()
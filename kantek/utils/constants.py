@@ -13,3 +13,28 @@ TELEGRAM_DOMAINS = ['t.me',
 GET_ENTITY_ERRORS = (UsernameNotOccupiedError, UsernameInvalidError, ValueError, InviteHashInvalidError, PeerIdInvalidError)
 
 DOWNLOAD_ERRORS = (AuthBytesInvalidError, FileIdInvalidError, FileReferenceExpiredError)
+
+# domains that serve t.me style links to users, chats and invites
+TELEGRAM_LINK_DOMAINS = ['t.me',
+                         'telegram.me',
+                         'telegram.dog']
+
+# only links on these domains are followed over HTTP, all others are checked by their domain alone
+URL_SHORTENERS = ['bit.ly',
+                  'bitly.com',
+                  'buff.ly',
+                  'clck.ru',
+                  'cutt.ly',
+                  'goo.gl',
+                  'is.gd',
+                  'lnkd.in',
+                  'ow.ly',
+                  'rb.gy',
+                  'rebrand.ly',
+                  's.id',
+                  'shorturl.at',
+                  't.co',
+                  't.ly',
+                  'tiny.cc',
+                  'tinyurl.com',
+                  'v.gd']
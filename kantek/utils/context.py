@@ -0,0 +1,69 @@
+"""Share lookups between all handlers of an update so they are only done once."""
+import asyncio
+import functools
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from telethon.events.common import EventCommon
+from telethon.tl.types import User
+
+from ..database.types import BannedUser
+from .tags import Tags
+
+
+class UpdateContext:
+    """Lazily fetched facts about the chat and users of an update
+
+    Every event built from the same update gets the same context, so a fact is fetched at most once
+    even if multiple plugins handle the update. Concurrent requests for the same fact wait for the first one.
+    Errors are remembered as well and raised to every caller.
+
+    Args:
+        event: The first event that was built from the update
+    """
+
+    def __init__(self, event: EventCommon) -> None:
+        self.event = event
+        self.client = event.client
+        self.chat_id: Optional[int] = event.chat_id
+        self._facts: Dict[Hashable, asyncio.Future] = {}
+
+    @classmethod
+    def of(cls, event: EventCommon) -> 'UpdateContext':
+        """Get the context of the update an event was built from"""
+        update = event.original_update if event.original_update is not None else event
+        context: Optional[UpdateContext] = getattr(update, '_kantek_context', None)
+        if context is None:
+            context = cls(event)
+            update._kantek_context = context  # pylint: disable = W0212
+        return context
+
+    async def chat(self):
+        """The chat the update happened in"""
+        return await self._get('chat', self.event.get_chat)
+
+    async def tags(self) -> Tags:
+        """The tags of the chat"""
+        return await self._get('tags', functools.partial(Tags.from_event, self.event))
+
+    async def user(self, uid: int) -> Optional[User]:
+        """The cached entity of a user or None if it is not known"""
+        return await self._get(('user', uid), functools.partial(self.client.get_cached_entity, uid))
+
+    async def is_admin(self, uid: int) -> bool:
+        """If a user is an admin or the creator of the chat"""
+        return await self._get(('admin', uid), functools.partial(self.client.is_admin, self.chat_id, uid))
+
+    async def is_participant(self, uid: int) -> bool:
+        """If a user is a participant of the chat"""
+        return await self._get(('participant', uid), functools.partial(self.client.is_participant, self.chat_id, uid))
+
+    async def ban(self, uid: int) -> Optional[BannedUser]:
+        """The ban of a user or None if they aren't banned"""
+        return await self._get(('ban', uid), functools.partial(self.client.db.banlist.get, uid))
+
+    async def _get(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._facts.get(key)
+        if future is None:
+            future = self._facts[key] = asyncio.ensure_future(fetch())
+        # a handler being cancelled shouldn't cancel the lookup for the other handlers
+        return await asyncio.shield(future)
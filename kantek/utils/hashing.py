@@ -0,0 +1,120 @@
+"""Hash photos in worker processes so decoding and hashing doesn't block the event loop."""
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from typing import Deque, Dict, Optional
+
+import photohash
+from PIL import Image, UnidentifiedImageError
+
+from .. import Config
+
+# amount of recent jobs the latency percentiles are calculated from
+LATENCY_WINDOW = 1_000
+
+
+def _average_hash(photo: bytes) -> str:
+    """Decode and hash a photo, runs in a worker process"""
+    return str(photohash.average_hash(Image.open(BytesIO(photo))))
+
+
+class PhotoHasher:
+    """Pool of worker processes that compute the average hash of photos
+
+    At most max_pending photos are hashed or waiting for a worker at the same time,
+    further callers wait until a job finishes.
+
+    Args:
+        workers: Amount of worker processes, 0 hashes in the default thread pool instead
+        max_pending: Maximum amount of jobs submitted to the pool at the same time
+    """
+
+    def __init__(self, workers: int, max_pending: int) -> None:
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: Optional[Executor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.jobs = 0
+        self.failed = 0
+        self.waiting = 0
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    async def hash(self, photo: bytes) -> str:
+        """Get the average hash of a photo
+
+        If a worker process dies the photo is hashed again in a new pool once.
+
+        Raises:
+            UnidentifiedImageError: If the photo can't be decoded or the worker died twice while hashing it
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        start = time.monotonic()
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            try:
+                return await self._run(photo)
+            except BrokenProcessPool:
+                # the worker might have been killed by another photo, try again in the new pool
+                try:
+                    return await self._run(photo)
+                except BrokenProcessPool as err:
+                    raise UnidentifiedImageError(f'The worker hashing the photo died: {err}') from err
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self._slots.release()
+            self.jobs += 1
+            self._latencies.append(time.monotonic() - start)
+
+    def stats(self) -> Dict[str, float]:
+        """Get the amount of jobs and the latency percentiles of the recent jobs in seconds"""
+        latencies = sorted(self._latencies)
+        stats = {'jobs': self.jobs, 'failed': self.failed, 'waiting': self.waiting}
+        if latencies:
+            stats['p50'] = latencies[len(latencies) // 2]
+            stats['p95'] = latencies[int(len(latencies) * 0.95)]
+            stats['max'] = latencies[-1]
+        return stats
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def _run(self, photo: bytes) -> str:
+        executor = self._get_executor()
+        try:
+            return await asyncio.get_event_loop().run_in_executor(executor, _average_hash, photo)
+        except BrokenProcessPool:
+            # the jobs of the other callers failed with the pool as well so it is only replaced once
+            if self._executor is executor:
+                self._executor = None
+            raise
+
+    def _get_executor(self) -> Optional[Executor]:
+        if self.workers <= 0:
+            return None
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+
+_hasher: Optional[PhotoHasher] = None
+
+
+def get_hasher() -> PhotoHasher:
+    """Get the photo hasher configured in the config"""
+    global _hasher  # pylint: disable = W0603
+    if _hasher is None:
+        config = Config()
+        _hasher = PhotoHasher(config.photo_hash_workers, config.photo_hash_queue_size)
+    return _hasher
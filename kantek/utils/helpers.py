@@ -6,18 +6,17 @@ import logging
 import re
 import subprocess
 import urllib
-from io import BytesIO, StringIO
-from typing import Dict, List, Tuple
+from io import StringIO
+from typing import Any, AsyncIterable, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
 
 import logzero
-import photohash
-from PIL import Image
 from telethon import utils
 from telethon.events import NewMessage
 from telethon.tl.custom import Message
-from telethon.tl.types import User, DocumentAttributeFilename, PeerChannel, PeerUser
+from telethon.tl.types import User, DocumentAttributeFilename, PeerChannel, PeerUser, Photo, PhotoStrippedSize
+from yarl import URL
 
-from . import parsers
+from . import parsers, hashing
 from .. import Config
 
 INVITELINK_PATTERN = re.compile(r'(?:joinchat|join)(?:/|\?invite=)(.*|)')
@@ -26,6 +25,9 @@ MESSAGE_LINK_PATTERN = re.compile(r't\.me/(?:c/)?(?P<chat>\w+)/(?P<id>\d+)')
 
 logger: logging.Logger = logzero.logger
 
+# the shortest longer side a thumbnail needs to have to be hashed instead of the full photo
+PHOTO_HASH_MIN_SIZE = 320
+
 
 async def get_args(event: NewMessage.Event, skip: int = 1) -> Tuple[Dict[str, str], List[str]]:
     """Get arguments from a event
@@ -88,6 +90,16 @@ async def netloc(url: str) -> str:
     return urllib.parse.urlparse(url).netloc
 
 
+def normalize_url(url: str) -> str:
+    """Normalize a URL so equivalent URLs can share a cache entry
+
+    Adds a missing scheme, lowercases the host and removes the fragment.
+    """
+    if not url.startswith('http'):
+        url = f'http://{url}'
+    return str(URL(url).with_fragment(None))
+
+
 def hash_file(file: bytes):
     """SHA512 hash the passed file"""
     hasher = hashlib.sha512()
@@ -95,12 +107,67 @@ def hash_file(file: bytes):
     return hasher.hexdigest()
 
 
-async def hash_photo(photo):
-    """Create the average hash of a photo"""
-    loop = asyncio.get_event_loop()
-    pil_photo = Image.open(BytesIO(photo))
-    photo_hash = await loop.run_in_executor(None, photohash.average_hash, pil_photo)
-    return str(photo_hash)
+async def hash_chunks(chunks: AsyncIterable[bytes], max_size: Optional[int] = None,
+                      progress_callback: Optional[Callable[[int], Any]] = None) -> Optional[str]:
+    """SHA512 hash a file while it is downloaded without keeping it in memory
+
+    >>> async def chunks():
+    ...     for chunk in (b'kan', b'tek'):
+    ...         yield chunk
+    >>> asyncio.run(hash_chunks(chunks())) == hash_file(b'kantek')
+    True
+    >>> asyncio.run(hash_chunks(chunks(), max_size=4)) is None
+    True
+
+    Args:
+        chunks: The parts of the file in order
+        max_size: Stop reading the file once it is larger than this many bytes
+        progress_callback: Called with the amount of bytes received after every chunk
+
+    Returns:
+        The hash or None if the file exceeded the maximum size
+    """
+    hasher = hashlib.sha512()
+    received = 0
+    async for chunk in chunks:
+        received += len(chunk)
+        if max_size is not None and received > max_size:
+            return None
+        hasher.update(chunk)
+        if progress_callback is not None:
+            progress_callback(received)
+    return hasher.hexdigest()
+
+
+async def hash_photo(photo: bytes) -> str:
+    """Create the average hash of a photo in one of the hashing processes"""
+    return await hashing.get_hasher().hash(photo)
+
+
+def photo_thumbnail(photo: Photo, min_size: int = PHOTO_HASH_MIN_SIZE) -> Optional[str]:
+    """Get the smallest size of a photo that is large enough to be hashed
+
+    Args:
+        photo: The photo
+        min_size: The minimum length of the longer side in pixels
+
+    Returns:
+        The type of the size that can be passed as `thumb` to download_media or
+        None if no size besides the full photo is large enough
+    """
+    sizes = [size for size in photo.sizes
+             if hasattr(size, 'w') and hasattr(size, 'h') and max(size.w, size.h) >= min_size]
+    if not sizes:
+        return None
+    return min(sizes, key=lambda size: size.w * size.h).type
+
+
+def stripped_thumbnail(photo: Photo) -> Optional[bytes]:
+    """Get the tiny preview that is sent along with a photo as a JPEG"""
+    for size in photo.sizes:
+        if isinstance(size, PhotoStrippedSize):
+            return utils.stripped_photo_to_jpg(size.bytes)
+    return None
 
 
 async def get_linked_message(client, link):
@@ -153,6 +220,56 @@ async def create_strafanzeige(uid, msg: Message):
     return data
 
 
+async def first_hit(checks: Sequence[Callable[[], Awaitable[Any]]], limit: int) -> Optional[Any]:
+    """Run checks concurrently and return the first truthy result in the order of the checks
+
+    Once a check has a result all checks after it are cancelled, the checks before it are still awaited.
+    This way the result is the same as running the checks one after another.
+
+    >>> async def check(delay, result):
+    ...     await asyncio.sleep(delay)
+    ...     return result
+    >>> asyncio.run(first_hit([lambda: check(0.02, None), lambda: check(0.01, 'b'), lambda: check(0, 'c')], limit=2))
+    'b'
+
+    Args:
+        checks: Functions returning the awaitable of each check
+        limit: The maximum amount of checks that run at the same time
+
+    Returns:
+        The result or None if no check had one
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def _run(check):
+        async with semaphore:
+            return await check()
+
+    tasks = [asyncio.ensure_future(_run(check)) for check in checks]
+    positions = {task: pos for pos, task in enumerate(tasks)}
+    best = len(tasks)
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if not task.cancelled() and task.exception() is None and task.result():
+                    best = min(best, positions[task])
+            for task in tasks[best + 1:]:
+                task.cancel()
+            if all(task.done() for task in tasks[:best + 1]):
+                break
+    finally:
+        for task in pending:
+            task.cancel()
+    for task in tasks[:best + 1]:
+        # exceptions of checks before the hit are raised like they would be when running sequentially
+        result = task.result()
+        if result:
+            return result
+    return None
+
+
 def get_commit():
     proc = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'])
     return proc.decode().strip()
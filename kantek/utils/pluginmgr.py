@@ -18,19 +18,22 @@ from telethon.errors import MessageTooLongError, FloodWaitError
 from telethon.events import NewMessage
 from telethon.events.common import EventBuilder
 from telethon.tl.custom import Forward, Message
-from telethon.tl.functions.channels import GetParticipantRequest
-from telethon.tl.types import ChannelParticipantAdmin, DocumentAttributeFilename
+from telethon.tl.types import DocumentAttributeFilename
 from telethon.utils import get_display_name
 
 from . import helpers
 from .. import Config
 from .constants import GET_ENTITY_ERRORS
+from .context import UpdateContext
 from .errors import Error
-from .tags import Tags
+from .scheduler import Priority, Scheduler
 
 logger = logzero.setup_logger('kantek-logger', level=logging.DEBUG)
 tlog = logging.getLogger('kantek-channel-log')
 
+# workers that only handle high priority events so they don't wait for slow checks
+HIGH_PRIORITY_WORKERS = 2
+
 
 @dataclass
 class _Signature:  # pylint: disable = R0902
@@ -42,6 +45,7 @@ class _Signature:  # pylint: disable = R0902
     kwargs: bool = False
     event: bool = False
     tags: bool = False
+    context: bool = False
 
 
 @dataclass
@@ -63,6 +67,7 @@ class _Command:
     auto_respond: bool
     document: bool
     delete: bool
+    priority: Priority
 
     subcommands: Optional[Dict[str, _SubCommand]] = None
 
@@ -89,6 +94,7 @@ class _Event:
     callback: Callable
     event: EventBuilder
     name: Optional[str]
+    priority: Priority
 
 
 class PluginManager:
@@ -99,11 +105,13 @@ class PluginManager:
     def __init__(self, client):
         self.client = client
         self.config = Config()
+        self.scheduler = Scheduler(self.config.event_workers, self.config.event_queue_size,
+                                   reserved=HIGH_PRIORITY_WORKERS)
         self._import_plugins()
 
     @classmethod
     def command(cls, *commands: str, private: bool = True, admins: bool = False,
-                document: bool = True, delete: bool = False):
+                document: bool = True, delete: bool = False, priority: Priority = Priority.HIGH):
         """Add a command to the client
 
         Args:
@@ -111,6 +119,7 @@ class PluginManager:
             private: True if the command should only be run when sent from the user
             admins: Set to True if chat admins should be allowed to use the command too
             document: If the help command should list this command
+            priority: High priority commands are run right away, others are queued like events
 
         Returns:
 
@@ -123,18 +132,24 @@ class PluginManager:
             auto_respond = (signature.return_annotation is KanTeXDocument
                             or signature.return_annotation is Optional[KanTeXDocument])
             args = _Signature(**{n: True for n in signature.parameters.keys()})
-            cmd = _Command(callback, private, admins, commands, args, auto_respond, document, delete)
+            cmd = _Command(callback, private, admins, commands, args, auto_respond, document, delete, priority)
             cls.commands[commands[0]] = cmd
             return cmd
 
         return decorator
 
     @classmethod
-    def event(cls, event, name: str = None):
-        """Add a Event to the client"""
+    def event(cls, event, name: str = None, priority: Priority = Priority.NORMAL):
+        """Add a Event to the client
+
+        Args:
+            event: The event to listen for
+            name: Name of the event shown in the help
+            priority: Events with a higher priority are handled first when many events are queued
+        """
 
         def decorator(callback):
-            cls.events.append(_Event(callback, event, name))
+            cls.events.append(_Event(callback, event, name, priority))
             return callback
 
         return decorator
@@ -149,10 +164,12 @@ class PluginManager:
             else:
                 event = events.NewMessage(outgoing=p.private, pattern=pattern)
             new_callback = functools.partial(self._callback, p, p.signature, p.admins)
+            if p.priority != Priority.HIGH:
+                new_callback = functools.partial(self._schedule_command, p.priority, new_callback)
             self.client.add_event_handler(new_callback, event)
 
         for e in self.events:
-            self.client.add_event_handler(functools.partial(self._event_callback, e), e.event)
+            self.client.add_event_handler(functools.partial(self._schedule_event, e), e.event)
 
     def _import_plugins(self) -> None:
         """Import all plugins so the decorators are run"""
@@ -165,6 +182,20 @@ class PluginManager:
                     loader: SourceFileLoader = _module.loader
                     loader.load_module()
 
+    async def _schedule_event(self, event: _Event, tg_event) -> None:
+        """Queue an event in the lane of its chat instead of handling it right away"""
+        tg_event.context = UpdateContext.of(tg_event)
+        chat_id = getattr(tg_event, 'chat_id', None)
+        coalesce_key = None
+        if isinstance(tg_event, events.MessageEdited.Event):
+            # only the latest version of a message that is edited while it waits needs to be handled
+            coalesce_key = (event.callback, tg_event.message.id)
+        self.scheduler.submit(chat_id, functools.partial(self._event_callback, event, tg_event), coalesce_key,
+                              event.priority)
+
+    async def _schedule_command(self, priority: Priority, callback: Callable, event: NewMessage.Event) -> None:
+        self.scheduler.submit(event.chat_id, functools.partial(callback, event), priority=priority)
+
     @staticmethod
     async def _event_callback(event: _Event, tg_event) -> None:
         try:
@@ -184,6 +215,7 @@ class PluginManager:
         """
         client = event.client
         msg: Message = event.message
+        context = event.context = UpdateContext.of(event)
         me = await client.get_me()
         if msg.via_bot_id is not None:
             return
@@ -217,14 +249,13 @@ class PluginManager:
 
         _kwargs, _args = await helpers.get_args(event, skip=skip_args)
 
-        chat = await event.get_chat()
+        chat = await context.chat()
         if admins and event.is_channel:
             uid = event.message.sender_id
             own_id = (await client.get_me()).id
             if uid != own_id and _kwargs.get('self', False) or (not chat.creator and not chat.admin_rights):
                 return
-            result = await client(GetParticipantRequest(event.chat_id, uid))
-            if not isinstance(result.participant, ChannelParticipantAdmin) and uid != own_id:
+            if uid != own_id and not await context.is_admin(uid):
                 return
 
         if _kwargs.get('help', False):
@@ -260,7 +291,10 @@ class PluginManager:
             callback_args['event'] = event
 
         if args.tags:
-            callback_args['tags'] = await Tags.from_event(event)
+            callback_args['tags'] = await context.tags()
+
+        if args.context:
+            callback_args['context'] = context
         from_id = event.message.sender_id
         if admins and from_id != me.id:
             try:
@@ -269,7 +303,7 @@ class PluginManager:
             except GET_ENTITY_ERRORS:
                 name = str(from_id)
             user_link = Mention(name, from_id)
-            group_link = Link(get_display_name(await event.get_chat()), f't.me/c/{event.chat.id}/{event.message.id}')
+            group_link = Link(get_display_name(chat), f't.me/c/{event.chat.id}/{event.message.id}')
             tlog.info(f'{user_link} ran {Code(command_name)} in {group_link}')
         result = None
         try:
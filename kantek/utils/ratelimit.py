@@ -0,0 +1,84 @@
+"""Limit how often requests are sent so they don't run into flood waits."""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from telethon.errors import FloodWaitError
+
+
+class RateLimiter:
+    """Token bucket that lets `rate` requests per second through with bursts of up to `burst` requests
+
+    A flood wait reported by Telegram pauses all requests of the limiter until it is over.
+
+    >>> async def main():
+    ...     limiter = RateLimiter(rate=100, burst=2)
+    ...     start = time.monotonic()
+    ...     for _ in range(4):
+    ...         async with limiter:
+    ...             pass
+    ...     return time.monotonic() - start >= 0.015
+    >>> asyncio.run(main())
+    True
+
+    Args:
+        rate: Requests per second
+        burst: Requests that can be sent at once after the limiter was idle
+    """
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.flood_waits = 0
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def __aenter__(self) -> None:
+        await self.acquire()
+
+    async def __aexit__(self, *exc_info) -> None:
+        pass
+
+    async def acquire(self) -> None:
+        """Wait until the next request can be sent"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """Don't let any requests through for the next seconds"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def run(self, request: Callable[[], Awaitable[Any]], retries: int = 2) -> Any:
+        """Send a request once the limiter lets it through and retry it after flood waits
+
+        Args:
+            request: Function returning the awaitable of the request
+            retries: How often the request is retried after a flood wait
+
+        Raises:
+            FloodWaitError: If the request still ran into a flood wait after the last retry
+        """
+        for attempt in range(retries + 1):
+            await self.acquire()
+            try:
+                return await request()
+            except FloodWaitError as err:
+                self.flood_waits += 1
+                self.pause(err.seconds)
+                if attempt == retries:
+                    raise
+        return None
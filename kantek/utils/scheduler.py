@@ -0,0 +1,154 @@
+"""Run event handlers in a fixed amount of workers with the events of each chat in order."""
+import asyncio
+import logging
+from collections import deque
+from enum import IntEnum
+from typing import Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Set, Tuple
+
+import logzero
+
+logger: logging.Logger = logzero.logger
+
+Job = Callable[[], Awaitable[None]]
+
+
+class Priority(IntEnum):
+    """Jobs with a lower value are started first"""
+    HIGH = 0
+    NORMAL = 1
+    LOW = 2
+
+
+class Scheduler:
+    """Queue jobs in one FIFO lane per chat that are drained by a pool of workers
+
+    Only one job of a lane runs at a time so the events of a chat are handled in the order they arrived,
+    while at most `workers` jobs run at the same time over all chats.
+
+    Every priority has its own lanes and free workers always start the job with the highest priority first.
+    The reserved workers only run high priority jobs so they are started quickly even if the other workers are
+    busy with slow jobs.
+
+    Jobs with a coalesce key replace a queued job of the same lane with the same key, this way only the latest
+    version of an edited message is handled. Once `max_queued` jobs are waiting new jobs are dropped,
+    except for high priority jobs.
+
+    Args:
+        workers: The maximum amount of jobs running at the same time
+        max_queued: The maximum amount of jobs waiting over all lanes
+        reserved: Amount of additional workers that only run high priority jobs
+    """
+
+    def __init__(self, workers: int, max_queued: int, reserved: int = 0) -> None:
+        self.workers = workers
+        self.reserved = reserved
+        self.max_queued = max_queued
+        self.queued = 0
+        self.running = 0
+        self.processed = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_depth = 0
+        self._lanes: Dict[Tuple[Priority, Hashable], Deque[List]] = {}
+        self._ready: Dict[Priority, Deque[Tuple[Priority, Hashable]]] = {priority: deque() for priority in Priority}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._scheduled: Set[Hashable] = set()
+        self._workers: List[asyncio.Task] = []
+
+    def submit(self, lane: Hashable, job: Job, coalesce_key: Optional[Hashable] = None,
+               priority: Priority = Priority.NORMAL) -> bool:
+        """Queue a job in a lane
+
+        Args:
+            lane: The lane of the job, usually the chat id
+            job: Function returning the awaitable to run
+            coalesce_key: Replace a queued job of the lane with the same key instead of adding a new one
+            priority: The priority of the job
+
+        Returns:
+            False if the job was dropped because the queue is full
+        """
+        self._start()
+        lane = (priority, lane)
+        queue = self._lanes.setdefault(lane, deque())
+        if coalesce_key is not None:
+            for entry in queue:
+                if entry[0] == coalesce_key:
+                    entry[1] = job
+                    self.coalesced += 1
+                    return True
+        if self.queued >= self.max_queued and priority != Priority.HIGH:
+            self.dropped += 1
+            if lane not in self._scheduled:
+                del self._lanes[lane]
+            logger.warning('Dropped a job for %s, %s jobs are queued already', lane, self.queued)
+            return False
+        queue.append([coalesce_key, job])
+        self.queued += 1
+        self.max_depth = max(self.max_depth, len(queue))
+        if lane not in self._scheduled:
+            self._scheduled.add(lane)
+            self._ready[priority].append(lane)
+            self._wakeup.set()
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        """Get the amount of queued, running and handled jobs"""
+        return {
+            'queued': self.queued,
+            'running': self.running,
+            'lanes': len(self._lanes),
+            'max_depth': self.max_depth,
+            'processed': self.processed,
+            'coalesced': self.coalesced,
+            'dropped': self.dropped,
+        }
+
+    def deepest_lanes(self, count: int = 5) -> List[Tuple[Hashable, int]]:
+        """Get the lanes with the most queued jobs"""
+        depths = [(lane, len(queue)) for lane, queue in self._lanes.items()]
+        return sorted(depths, key=lambda depth: depth[1], reverse=True)[:count]
+
+    def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
+
+    def _start(self) -> None:
+        if self._workers:
+            return
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        self._workers = [asyncio.ensure_future(self._work(tuple(Priority))) for _ in range(self.workers)]
+        self._workers += [asyncio.ensure_future(self._work((Priority.HIGH,))) for _ in range(self.reserved)]
+
+    def _next_lane(self, priorities: Tuple[Priority, ...]) -> Optional[Tuple[Priority, Hashable]]:
+        for priority in priorities:
+            if self._ready[priority]:
+                return self._ready[priority].popleft()
+        return None
+
+    async def _work(self, priorities: Tuple[Priority, ...]) -> None:
+        while True:
+            lane = self._next_lane(priorities)
+            if lane is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            queue = self._lanes[lane]
+            _, job = queue.popleft()
+            self.queued -= 1
+            self.running += 1
+            try:
+                await job()
+            except Exception as err:  # pylint: disable = W0703
+                logger.exception(err)
+            finally:
+                self.running -= 1
+                self.processed += 1
+                if queue:
+                    self._ready[lane[0]].append(lane)
+                    self._wakeup.set()
+                else:
+                    del self._lanes[lane]
+                    self._scheduled.discard(lane)
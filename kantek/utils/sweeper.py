@@ -0,0 +1,164 @@
+"""Ban users that were gbanned after they joined a chat."""
+import asyncio
+import datetime
+import logging
+from typing import Dict, List, Optional
+
+import logzero
+from kantex.md import Code
+from telethon.errors import FloodWaitError, RPCError
+from telethon.tl.functions.channels import GetParticipantsRequest
+from telethon.tl.types import (Channel, ChannelParticipantsRecent, ChannelParticipantAdmin,
+                               ChannelParticipantCreator)
+from telethon.tl.types.channels import ChannelParticipants
+from telethon.utils import get_peer_id
+
+from .ratelimit import RateLimiter
+
+logger: logging.Logger = logzero.logger
+tlog = logging.getLogger('kantek-channel-log')
+
+# participants fetched with one request, 200 is the most telegram returns
+SWEEP_CHUNK_SIZE = 200
+# requests for participants per second
+SWEEP_REQUEST_RATE = 0.5
+SWEEP_BAN_RATE = 1
+SWEEP_BAN_BURST = 5
+# seconds until chats are checked for a due sweep again
+SWEEP_IDLE = 10 * 60
+
+
+class Sweeper:
+    """Ban participants of chats that are on the banlist
+
+    grenzschutz only checks users when they join or write a message, users that were gbanned after joining a chat
+    are found by walking the participants of every chat where we can ban. Every chat is swept once per interval,
+    the chats with the oldest sweep first. The progress is saved after every chunk of participants so a sweep
+    continues where it stopped after a restart. While events are waiting to be handled the sweep pauses.
+
+    Telegram only returns the 10000 most recent participants of a chat so larger chats are only partially swept.
+
+    Args:
+        client: The client
+        interval: Hours between two sweeps of a chat
+    """
+
+    def __init__(self, client: 'Client', interval: float) -> None:
+        self.client = client
+        self.interval = datetime.timedelta(hours=interval)
+        self.current: Optional[Channel] = None
+        self.swept = 0
+        self.checked = 0
+        self.banned = 0
+        self._requests = RateLimiter(SWEEP_REQUEST_RATE)
+        self._bans = RateLimiter(SWEEP_BAN_RATE, SWEEP_BAN_BURST)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> Dict[str, int]:
+        """Get the amount of swept chats, checked participants and bans since the start"""
+        return {
+            'swept': self.swept,
+            'checked': self.checked,
+            'banned': self.banned,
+            'flood_waits': self._requests.flood_waits + self._bans.flood_waits,
+        }
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                chats = await self._due_chats()
+            except Exception as err:  # pylint: disable = W0703
+                logger.exception(err)
+                chats = []
+            for chat in chats:
+                try:
+                    await self._sweep(chat)
+                except Exception as err:  # pylint: disable = W0703
+                    # the sweep of the chat continues from the saved offset the next time
+                    logger.exception(err)
+            await asyncio.sleep(SWEEP_IDLE)
+
+    async def _due_chats(self) -> List[Channel]:
+        """Get the chats where we can ban that weren't swept in the interval, the oldest sweep first"""
+        db = self.client.db
+        due = []
+        async for dialog in self.client.iter_dialogs():
+            chat = dialog.entity
+            if not isinstance(chat, Channel) or not chat.megagroup:
+                continue
+            if not chat.creator and not (chat.admin_rights and chat.admin_rights.ban_users):
+                continue
+            chat_id = get_peer_id(chat)
+            row = await db.chats.get(chat_id)
+            if row is None:
+                row = await db.chats.add(chat_id, chat.title)
+            if row.tags.get('polizei') == 'exclude' or row.tags.get('grenzschutz') == 'exclude':
+                continue
+            if row.last_sweep is not None and row.last_sweep > datetime.datetime.now() - self.interval:
+                continue
+            due.append((row.last_sweep or datetime.datetime.min, chat))
+        return [chat for _, chat in sorted(due, key=lambda item: item[0])]
+
+    async def _sweep(self, chat: Channel) -> None:
+        db = self.client.db
+        chat_id = get_peer_id(chat)
+        row = await db.chats.get(chat_id)
+        offset = row.sweep_offset if row else 0
+        banned = 0
+        self.current = chat
+        try:
+            while True:
+                await self._wait_idle()
+                result: ChannelParticipants = await self._requests.run(lambda: self.client(GetParticipantsRequest(
+                    chat, ChannelParticipantsRecent(), offset, SWEEP_CHUNK_SIZE, hash=0)))
+                if not result.participants:
+                    break
+                admin_types = (ChannelParticipantAdmin, ChannelParticipantCreator)
+                uids = [p.user_id for p in result.participants if not isinstance(p, admin_types)]
+                chunk_bans = 0
+                for ban in await db.banlist.get_multiple(uids):
+                    try:
+                        removed = await self._bans.run(lambda: self.client.ban(chat, ban.id))  # pylint: disable = W0640
+                    except FloodWaitError:
+                        raise
+                    except (RPCError, ValueError) as err:
+                        # the user stays in the chat, the rest of the chunk is still checked
+                        logger.warning('Could not ban %s in %s: %s', ban.id, chat_id, err)
+                        continue
+                    if removed:
+                        chunk_bans += 1
+                banned += chunk_bans
+                # banned users are removed from the participants so the following ones move up
+                offset += len(result.participants) - chunk_bans
+                self.checked += len(result.participants)
+                await db.chats.update_sweep(chat_id, offset)
+                if len(result.participants) < SWEEP_CHUNK_SIZE:
+                    break
+        except FloodWaitError:
+            # not finished, the sweep continues from the saved offset once the flood wait is over
+            raise
+        except RPCError as err:
+            # the chat is skipped until the next interval
+            logger.warning('Could not sweep %s: %s', chat_id, err)
+        finally:
+            self.current = None
+            self.banned += banned
+        await db.chats.finish_sweep(chat_id)
+        self.swept += 1
+        if banned:
+            tlog.info(f'Banned {banned} users on the banlist in {Code(chat.title)} [{Code(chat_id)}]')
+
+    async def _wait_idle(self) -> None:
+        """Wait until no events are waiting to be handled"""
+        scheduler = self.client.plugin_mgr.scheduler
+        while scheduler.queued:
+            await asyncio.sleep(1)
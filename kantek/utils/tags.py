@@ -34,8 +34,11 @@ class Tags:
             chat = await self.db.chats.get(self.chat_id)
             if not chat:
                 chat = await self.db.chats.add(self.chat_id)
-            self.named_tags = chat.tags
+            self.title = chat.title
+            # the chat is cached and shared, changes are only applied to it by saving them
+            self.named_tags = dict(chat.tags)
         else:
+            self.title = None
             self.named_tags = {
                 "polizei": "exclude"
             }
@@ -0,0 +1,139 @@
+"""Parse and classify URLs without any network requests."""
+from typing import NamedTuple, Optional
+from urllib.parse import parse_qs
+
+from yarl import URL
+
+from .constants import TELEGRAM_LINK_DOMAINS, URL_SHORTENERS
+
+
+class TelegramLink(NamedTuple):
+    """The parts of a link to a Telegram user, chat or invite"""
+    username: Optional[str] = None
+    invite_hash: Optional[str] = None
+    start: Optional[str] = None
+
+
+class ResolvedURL(NamedTuple):
+    """A URL after following redirects where necessary"""
+    url: str
+    domain: str
+    telegram: Optional[TelegramLink] = None
+
+
+def base_domain(host: Optional[str]) -> str:
+    """Strip all subdomains from a host
+
+    >>> base_domain('www.sitischu.com')
+    'sitischu.com'
+
+    >>> base_domain('sitischu.com')
+    'sitischu.com'
+
+    >>> base_domain('localhost')
+    'localhost'
+
+    >>> base_domain(None)
+    ''
+    """
+    if not host:
+        return ''
+    return host.split('.', maxsplit=host.count('.') - 1)[-1] or host
+
+
+def is_shortener(host: Optional[str]) -> bool:
+    """Check if a host is a known URL shortener
+
+    >>> is_shortener('bit.ly')
+    True
+
+    >>> is_shortener('www.bit.ly')
+    True
+
+    >>> is_shortener('example.com')
+    False
+    """
+    return base_domain(host) in URL_SHORTENERS
+
+
+def parse_telegram_link(url: str) -> Optional[TelegramLink]:
+    """Extract the username, invite hash and start parameter from a Telegram link
+
+    Returns None if the url doesn't point to Telegram.
+
+    >>> parse_telegram_link('https://t.me/durov')
+    TelegramLink(username='durov', invite_hash=None, start=None)
+
+    >>> parse_telegram_link('t.me/@somebot?start=ref123')
+    TelegramLink(username='somebot', invite_hash=None, start='ref123')
+
+    >>> parse_telegram_link('https://t.me/joinchat/AAAAAEAjAzYcMrqBCiWyoA')
+    TelegramLink(username=None, invite_hash='AAAAAEAjAzYcMrqBCiWyoA', start=None)
+
+    >>> parse_telegram_link('https://t.me/+AAAAAEAjAzYcMrqBCiWyoA')
+    TelegramLink(username=None, invite_hash='AAAAAEAjAzYcMrqBCiWyoA', start=None)
+
+    >>> parse_telegram_link('https://t.me/s/kantek/123')
+    TelegramLink(username='kantek', invite_hash=None, start=None)
+
+    >>> parse_telegram_link('https://kantek.t.me')
+    TelegramLink(username='kantek', invite_hash=None, start=None)
+
+    >>> parse_telegram_link('tg://resolve?domain=somebot&start=ref123')
+    TelegramLink(username='somebot', invite_hash=None, start='ref123')
+
+    >>> parse_telegram_link('tg://join?invite=AAAAAEAjAzYcMrqBCiWyoA')
+    TelegramLink(username=None, invite_hash='AAAAAEAjAzYcMrqBCiWyoA', start=None)
+
+    >>> parse_telegram_link('https://example.com/durov') is None
+    True
+
+    Args:
+        url: The url, with or without scheme
+
+    Returns:
+        The parsed link or None
+    """
+    if url.startswith('tg://'):
+        action, _, query = url[len('tg://'):].partition('?')
+        params = parse_qs(query)
+        if action == 'resolve':
+            return TelegramLink(username=_first(params, 'domain'), start=_first(params, 'start', 'startgroup'))
+        elif action == 'join':
+            return TelegramLink(invite_hash=_first(params, 'invite'))
+        return None
+
+    if not url.startswith('http'):
+        url = f'http://{url}'
+    try:
+        parsed = URL(url)
+    except ValueError:
+        return None
+    host = parsed.host or ''
+    if host.startswith('www.'):
+        host = host[len('www.'):]
+    start = parsed.query.get('start') or parsed.query.get('startgroup')
+    subdomain, _, domain = host.partition('.')
+    if domain in TELEGRAM_LINK_DOMAINS:
+        return TelegramLink(username=subdomain, start=start)
+    if host not in TELEGRAM_LINK_DOMAINS:
+        return None
+
+    path = [p for p in parsed.path.split('/') if p]
+    if not path:
+        return TelegramLink()
+    if path[0] == 'joinchat' and len(path) > 1:
+        return TelegramLink(invite_hash=path[1])
+    if path[0].startswith('+'):
+        return TelegramLink(invite_hash=path[0][1:])
+    if path[0] == 's' and len(path) > 1:
+        path = path[1:]
+    # some spammers started prefixing usernames with an @, only Telegram X supports it
+    return TelegramLink(username=path[0].replace('@', ''), start=start)
+
+
+def _first(params, *names: str) -> Optional[str]:
+    for name in names:
+        if name in params:
+            return params[name][0]
+    return None
@@ -0,0 +1,7 @@
+DROP TRIGGER IF EXISTS notify_change ON blacklists.bio;
+DROP TRIGGER IF EXISTS notify_change ON blacklists.string;
+DROP TRIGGER IF EXISTS notify_change ON blacklists.channel;
+DROP TRIGGER IF EXISTS notify_change ON blacklists.domain;
+DROP TRIGGER IF EXISTS notify_change ON blacklists.file;
+DROP TRIGGER IF EXISTS notify_change ON blacklists.mhash;
+DROP FUNCTION IF EXISTS blacklists.notify_change();
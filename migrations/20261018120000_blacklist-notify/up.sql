@@ -0,0 +1,38 @@
+CREATE OR REPLACE FUNCTION blacklists.notify_change() RETURNS TRIGGER AS
+$$
+DECLARE
+    changed RECORD;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        changed := OLD;
+    ELSE
+        changed := NEW;
+    END IF;
+    PERFORM pg_notify('blacklists', json_build_object('table', TG_TABLE_NAME, 'id', changed.id)::TEXT);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS notify_change ON blacklists.bio;
+CREATE TRIGGER notify_change AFTER INSERT OR UPDATE OR DELETE ON blacklists.bio
+    FOR EACH ROW EXECUTE PROCEDURE blacklists.notify_change();
+
+DROP TRIGGER IF EXISTS notify_change ON blacklists.string;
+CREATE TRIGGER notify_change AFTER INSERT OR UPDATE OR DELETE ON blacklists.string
+    FOR EACH ROW EXECUTE PROCEDURE blacklists.notify_change();
+
+DROP TRIGGER IF EXISTS notify_change ON blacklists.channel;
+CREATE TRIGGER notify_change AFTER INSERT OR UPDATE OR DELETE ON blacklists.channel
+    FOR EACH ROW EXECUTE PROCEDURE blacklists.notify_change();
+
+DROP TRIGGER IF EXISTS notify_change ON blacklists.domain;
+CREATE TRIGGER notify_change AFTER INSERT OR UPDATE OR DELETE ON blacklists.domain
+    FOR EACH ROW EXECUTE PROCEDURE blacklists.notify_change();
+
+DROP TRIGGER IF EXISTS notify_change ON blacklists.file;
+CREATE TRIGGER notify_change AFTER INSERT OR UPDATE OR DELETE ON blacklists.file
+    FOR EACH ROW EXECUTE PROCEDURE blacklists.notify_change();
+
+DROP TRIGGER IF EXISTS notify_change ON blacklists.mhash;
+CREATE TRIGGER notify_change AFTER INSERT OR UPDATE OR DELETE ON blacklists.mhash
+    FOR EACH ROW EXECUTE PROCEDURE blacklists.notify_change();
@@ -0,0 +1 @@
+DROP TABLE IF EXISTS resolved_urls;
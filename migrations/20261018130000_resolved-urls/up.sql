@@ -0,0 +1,6 @@
+CREATE TABLE IF NOT EXISTS resolved_urls
+(
+    url      TEXT      NOT NULL PRIMARY KEY,
+    resolved TEXT,
+    expires  TIMESTAMP NOT NULL
+);
@@ -0,0 +1,7 @@
+CREATE TABLE IF NOT EXISTS photo_hashes
+(
+    photo_id BIGINT NOT NULL,
+    dc_id    INT    NOT NULL,
+    hash     TEXT   NOT NULL,
+    PRIMARY KEY (photo_id, dc_id)
+);
@@ -0,0 +1,5 @@
+CREATE TABLE IF NOT EXISTS document_hashes
+(
+    document_id BIGINT NOT NULL PRIMARY KEY,
+    hash        TEXT   NOT NULL
+);
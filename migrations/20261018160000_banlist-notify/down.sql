@@ -0,0 +1,4 @@
+DROP TRIGGER IF EXISTS notify_insert ON banlist;
+DROP TRIGGER IF EXISTS notify_update ON banlist;
+DROP TRIGGER IF EXISTS notify_delete ON banlist;
+DROP FUNCTION IF EXISTS notify_banlist_change();
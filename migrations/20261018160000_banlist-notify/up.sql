@@ -0,0 +1,38 @@
+-- notifications are limited to 8000 bytes, larger changes only send the operation and the listeners reload the banlist
+CREATE OR REPLACE FUNCTION notify_banlist_change() RETURNS TRIGGER AS
+$$
+DECLARE
+    ids BIGINT[];
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        SELECT array_agg(id) INTO ids FROM (SELECT id FROM old_rows LIMIT 301) AS changed;
+    ELSE
+        SELECT array_agg(id) INTO ids FROM (SELECT id FROM new_rows LIMIT 301) AS changed;
+    END IF;
+    IF ids IS NULL THEN
+        RETURN NULL;
+    END IF;
+    IF array_length(ids, 1) > 300 THEN
+        PERFORM pg_notify('banlist', json_build_object('op', TG_OP)::TEXT);
+    ELSE
+        PERFORM pg_notify('banlist', json_build_object('op', TG_OP, 'ids', ids)::TEXT);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- triggers with transition tables can only have a single event
+DROP TRIGGER IF EXISTS notify_insert ON banlist;
+CREATE TRIGGER notify_insert AFTER INSERT ON banlist
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE notify_banlist_change();
+
+DROP TRIGGER IF EXISTS notify_update ON banlist;
+CREATE TRIGGER notify_update AFTER UPDATE ON banlist
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE notify_banlist_change();
+
+DROP TRIGGER IF EXISTS notify_delete ON banlist;
+CREATE TRIGGER notify_delete AFTER DELETE ON banlist
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE notify_banlist_change();
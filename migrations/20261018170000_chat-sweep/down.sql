@@ -0,0 +1,2 @@
+ALTER TABLE chats DROP COLUMN IF EXISTS last_sweep;
+ALTER TABLE chats DROP COLUMN IF EXISTS sweep_offset;
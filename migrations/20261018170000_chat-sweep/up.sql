@@ -0,0 +1,2 @@
+ALTER TABLE chats ADD COLUMN IF NOT EXISTS last_sweep TIMESTAMP;
+ALTER TABLE chats ADD COLUMN IF NOT EXISTS sweep_offset INTEGER NOT NULL DEFAULT 0;
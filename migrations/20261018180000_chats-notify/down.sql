@@ -0,0 +1,2 @@
+DROP TRIGGER IF EXISTS notify_change ON chats;
+DROP FUNCTION IF EXISTS notify_chat_change();
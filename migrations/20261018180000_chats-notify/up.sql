@@ -0,0 +1,18 @@
+CREATE OR REPLACE FUNCTION notify_chat_change() RETURNS TRIGGER AS
+$$
+DECLARE
+    changed RECORD;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        changed := OLD;
+    ELSE
+        changed := NEW;
+    END IF;
+    PERFORM pg_notify('chats', changed.id::TEXT);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS notify_change ON chats;
+CREATE TRIGGER notify_change AFTER INSERT OR UPDATE OR DELETE ON chats
+    FOR EACH ROW EXECUTE PROCEDURE notify_chat_change();
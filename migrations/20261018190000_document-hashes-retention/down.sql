@@ -0,0 +1 @@
+ALTER TABLE document_hashes DROP COLUMN IF EXISTS added;
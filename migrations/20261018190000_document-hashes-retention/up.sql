@@ -0,0 +1 @@
+ALTER TABLE document_hashes ADD COLUMN IF NOT EXISTS added TIMESTAMP NOT NULL DEFAULT now();
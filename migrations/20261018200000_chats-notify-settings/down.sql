@@ -0,0 +1,4 @@
+DROP TRIGGER IF EXISTS notify_update ON chats;
+DROP TRIGGER IF EXISTS notify_change ON chats;
+CREATE TRIGGER notify_change AFTER INSERT OR UPDATE OR DELETE ON chats
+    FOR EACH ROW EXECUTE PROCEDURE notify_chat_change();
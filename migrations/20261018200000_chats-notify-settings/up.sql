@@ -0,0 +1,14 @@
+-- the sweep progress and the title are written often and don't need to be dropped from the caches of other
+-- instances, so only changes of the settings are sent
+DROP TRIGGER IF EXISTS notify_change ON chats;
+CREATE TRIGGER notify_change AFTER INSERT OR DELETE ON chats
+    FOR EACH ROW EXECUTE PROCEDURE notify_chat_change();
+
+DROP TRIGGER IF EXISTS notify_update ON chats;
+CREATE TRIGGER notify_update AFTER UPDATE ON chats
+    FOR EACH ROW
+    WHEN (OLD.tags IS DISTINCT FROM NEW.tags
+        OR OLD.permissions IS DISTINCT FROM NEW.permissions
+        OR OLD.locked IS DISTINCT FROM NEW.locked
+        OR OLD.raid_start IS DISTINCT FROM NEW.raid_start)
+    EXECUTE PROCEDURE notify_chat_change();